@@ -0,0 +1,676 @@
+from Piece import Piece
+from Position import POSITIONS
+from Board import Board, SQUARES, EMPTY, WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING, PIECE_SQUARE
+from Zobrist import ZOBRIST, MIRRORED
+
+
+# BitBoard is an alternative representation of a Board. It keeps the same interface (so bots can use it exactly like a Board),
+# but internally it stores the whole position in four integers: white men, white kings, black men and black kings.
+# Just like in Board, white is the player who moves next.
+
+# Only the 50 dark squares (those with (x + y) even) can be occupied. They are packed into bits using a layout with 'ghost' bits:
+# a pair of rows (2k, 2k + 1) takes 11 bits - five bits of the even row, one unused ghost bit and five bits of the odd row.
+# Thanks to the ghost bits each diagonal direction is a constant shift of the whole bitboard:
+# (+1, +1) is << 6, (+1, -1) is << 5, (-1, -1) is >> 6 and (-1, +1) is >> 5. A step off the board always lands on a ghost bit
+# or outside of the 55 used bits, so it is removed by masking with VALID.
+
+
+# Bit index of the square (y, x)
+def square_bit(y, x):
+    return 11 * (y // 2) + (6 if y % 2 else 0) + x // 2
+
+
+# BIT_SQUARES[b] is the square (y, x) represented by bit b (None for ghost bits)
+BIT_SQUARES = [None] * 55
+for _y in range(10):
+    for _x in range(_y % 2, 10, 2):
+        BIT_SQUARES[square_bit(_y, _x)] = (_y, _x)
+
+# BIT_POSITIONS[b] is the shared Position of the square represented by bit b, as returned in moves
+BIT_POSITIONS = [POSITIONS[10 * square[0] + square[1]] if square is not None else None for square in BIT_SQUARES]
+
+# BIT_VALUE_POSITIONS[1 << b] is the same Position, looked up by the bit itself (move generation finds squares as bits)
+BIT_VALUE_POSITIONS = {1 << b: BIT_POSITIONS[b] for b in range(55) if BIT_POSITIONS[b] is not None}
+
+# All the bits which represent squares of the board
+VALID = sum(1 << b for b in range(55) if BIT_SQUARES[b] is not None)
+
+# The bits of every row: ROWS[y]
+ROWS = [sum(1 << square_bit(y, x) for x in range(y % 2, 10, 2)) for y in range(10)]
+
+# The piece-square values (see Board.PIECE_SQUARE) as (value, bits) pairs, one per value: PLACEMENT_BITS[white][king]
+# holds the bits where a piece of the player who moves next (white) or of the other player is worth value
+PLACEMENT_BITS = [[[(value, sum(1 << square_bit(y, x) for (y, x) in SQUARES
+                                if PIECE_SQUARE[king][y if white else 9 - y][x if white else 9 - x] == value))
+                    for value in sorted(set(v for row in PIECE_SQUARE[king] for v in row)) if value != 0]
+                   for king in range(2)] for white in range(2)]
+
+# The rows where men get crowned
+WHITE_CROWN_ROW = sum(1 << square_bit(9, x) for x in range(1, 10, 2))
+
+# Zobrist numbers of pieces standing on each bit: BIT_ZOBRIST[white][king][b], and the same after turning the board around
+BIT_ZOBRIST = [[[ZOBRIST[white][king][BIT_SQUARES[b][0]][BIT_SQUARES[b][1]] if BIT_SQUARES[b] else 0 for b in range(55)]
+                for king in range(2)] for white in range(2)]
+BIT_MIRRORED = [[[MIRRORED[white][king][BIT_SQUARES[b][0]][BIT_SQUARES[b][1]] if BIT_SQUARES[b] else 0 for b in range(55)]
+                 for king in range(2)] for white in range(2)]
+
+
+# Shift a bitboard one step forward (towards larger y)
+def forward_left(bits):
+    return (bits << 5) & VALID
+
+def forward_right(bits):
+    return (bits << 6) & VALID
+
+# Shift a bitboard one step backward (towards smaller y)
+def backward_left(bits):
+    return bits >> 6
+
+def backward_right(bits):
+    return bits >> 5
+
+SHIFTS = [forward_left, forward_right, backward_left, backward_right]
+
+
+# Check if any of the kings can capture: all of them slide together over empty squares in each direction until they meet
+# a piece, which can be captured if it's black and the square just behind it is empty
+def kings_can_capture(kings, black, empty):
+    if kings:
+        for step in (5, 6):
+            front = kings << step
+            while front:
+                if (front & black) << step & empty:
+                    return True
+                front = (front & empty) << step
+        for step in (6, 5):
+            front = kings >> step
+            while front:
+                if (front & black) >> step & empty:
+                    return True
+                front = (front & empty) >> step
+    return False
+
+
+# REVERSED[bits] is the number of 11 bits (a pair of rows) written in the reverse order
+REVERSED = [int(format(bits, '011b')[::-1], 2) for bits in range(1 << 11)]
+
+
+# Reverse the 55 used bits, which turns the board around (square (y, x) goes to (9 - y, 9 - x)):
+# the five pairs of rows swap places and each of them is reversed
+def reverse_bits(bits):
+    return (REVERSED[bits & 2047] << 44 | REVERSED[bits >> 11 & 2047] << 33 | REVERSED[bits >> 22 & 2047] << 22 |
+            REVERSED[bits >> 33 & 2047] << 11 | REVERSED[bits >> 44])
+
+
+# Iterate over the indices of the set bits
+def iterate_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BitBoard:
+    # Initializes the board to a starting configuration
+    def __init__(self):
+        self.white_men = sum(1 << square_bit(y, x) for y in range(3) for x in range(y % 2, 10, 2))
+        self.white_kings = 0
+        self.black_men = sum(1 << square_bit(y, x) for y in range(7, 10) for x in range(y % 2, 10, 2))
+        self.black_kings = 0
+        self._views = None
+        # Zobrist keys of the board and of the board turned around (see Board), so revert only has to swap them
+        self._keys = [0, 0]
+        self._toggle_keys(self.white_men, True, False)
+        self._toggle_keys(self.black_men, False, False)
+        # The keys of the earlier positions (see Board.repetitions), the oldest first
+        self.key_history = []
+        # The stack of positions before the moves made with push, which pop can take back
+        self.undo_stack = []
+
+
+    # Initializes an empty board (with no pieces on it)
+    @staticmethod
+    def empty_board():
+        to_return = BitBoard()
+        to_return.white_men = to_return.white_kings = to_return.black_men = to_return.black_kings = 0
+        to_return._keys = [0, 0]
+        return to_return
+
+
+    # The features of the position, exactly like Board.features. They are counted with a few operations on whole rows
+    # of bits, so a BitBoard doesn't have to keep sums up to date
+    def features(self):
+        white_men, black_men = self.white_men, self.black_men
+        return (white_men.bit_count(), self.white_kings.bit_count(),
+                sum(y * (white_men & ROWS[y]).bit_count() for y in range(1, 10)),
+                self._placement(True, white_men, self.white_kings),
+                black_men.bit_count(), self.black_kings.bit_count(),
+                sum((9 - y) * (black_men & ROWS[y]).bit_count() for y in range(9)),
+                self._placement(False, black_men, self.black_kings))
+
+
+    # The sum of the piece-square values of the men and kings of the player who moves next (white) or of the other player
+    def _placement(self, white, men, kings):
+        total = 0
+        for value, bits in PLACEMENT_BITS[white][False]:
+            total += value * (men & bits).bit_count()
+        for value, bits in PLACEMENT_BITS[white][True]:
+            total += value * (kings & bits).bit_count()
+        return total
+
+
+    # How many times the position occurred before in the game (see Board.repetitions)
+    def repetitions(self):
+        return self.key_history[-2::-2].count(self.key)
+
+
+    # Create a BitBoard representing the same position as a Board
+    @staticmethod
+    def from_board(board):
+        to_return = BitBoard.empty_board()
+        for white in board.whites:
+            to_return.newWhite(white.y, white.x, white.king)
+        for black in board.blacks:
+            to_return.newBlack(black.y, black.x, black.king)
+        return to_return
+
+
+    # Create a Board representing the same position
+    def to_board(self):
+        board = Board.empty_board()
+        for white in self.whites:
+            board.world[white.y][white.x] = board.newWhite(white.y, white.x, white.king)
+        for black in self.blacks:
+            board.world[black.y][black.x] = board.newBlack(black.y, black.x, black.king)
+        return board
+
+
+    # Return the position as 50 bytes, one per dark square, in the same format as Board.serialize
+    def serialize(self):
+        data = bytearray(50)
+        for code, bits in [(WHITE_MAN, self.white_men), (WHITE_KING, self.white_kings),
+                           (BLACK_MAN, self.black_men), (BLACK_KING, self.black_kings)]:
+            for b in iterate_bits(bits):
+                y, x = BIT_SQUARES[b]
+                data[5 * y + x // 2] = code
+        return bytes(data)
+
+
+    # Create a board from the result of serialize (of a Board or a BitBoard)
+    @staticmethod
+    def deserialize(data):
+        board = BitBoard.empty_board()
+        for index in range(50):
+            if data[index] != EMPTY:
+                y, x = SQUARES[index]
+                if data[index] <= WHITE_KING:
+                    board.newWhite(y, x, data[index] == WHITE_KING)
+                else:
+                    board.newBlack(y, x, data[index] == BLACK_KING)
+        return board
+
+
+    # Create a new white piece at position (y, x)
+    def newWhite(self, y, x, king=False):
+        if king:
+            self.white_kings |= 1 << square_bit(y, x)
+        else:
+            self.white_men |= 1 << square_bit(y, x)
+        self._toggle_keys(1 << square_bit(y, x), True, king)
+        self._views = None
+        return Piece.whitePiece(y, x, king)
+
+
+    # Create a new black piece at position (y, x)
+    def newBlack(self, y, x, king=False):
+        if king:
+            self.black_kings |= 1 << square_bit(y, x)
+        else:
+            self.black_men |= 1 << square_bit(y, x)
+        self._toggle_keys(1 << square_bit(y, x), False, king)
+        self._views = None
+        return Piece.blackPiece(y, x, king)
+
+
+    # Add or remove the numbers of the pieces standing on the given bits from the keys of the board
+    def _toggle_keys(self, bits, white, king):
+        numbers = BIT_ZOBRIST[white][king]
+        mirrored = BIT_MIRRORED[white][king]
+        for b in iterate_bits(bits):
+            self._keys[0] ^= numbers[b]
+            self._keys[1] ^= mirrored[b]
+
+
+    # The Zobrist key of the position
+    @property
+    def key(self):
+        return self._keys[0]
+
+
+    # The lists of pieces and the world grid are built only when someone asks for them, and then kept until the board changes
+    # They are read-only views: modifying them doesn't change the board
+    def _build_views(self):
+        world = [[None for x in range(10)] for y in range(10)]
+        whites = []
+        blacks = []
+        for b in iterate_bits(self.white_men | self.white_kings):
+            y, x = BIT_SQUARES[b]
+            world[y][x] = Piece.whitePiece(y, x, bool(self.white_kings >> b & 1))
+            whites += [world[y][x]]
+        for b in iterate_bits(self.black_men | self.black_kings):
+            y, x = BIT_SQUARES[b]
+            world[y][x] = Piece.blackPiece(y, x, bool(self.black_kings >> b & 1))
+            blacks += [world[y][x]]
+        self._views = (whites, blacks, world)
+        return self._views
+
+    @property
+    def whites(self):
+        return (self._views or self._build_views())[0]
+
+    @property
+    def blacks(self):
+        return (self._views or self._build_views())[1]
+
+    @property
+    def world(self):
+        return (self._views or self._build_views())[2]
+
+
+    # Check if a Position where is on the board
+    def on_board(self, where):
+        return 0 <= where.y and where.y < 10 and 0 <= where.x and where.x < 10
+
+
+    # Return the bit of the square at a Position (0 if it is off the board or isn't a dark square)
+    def _bit(self, where):
+        if not self.on_board(where) or (where.y + where.x) % 2 != 0:
+            return 0
+        return 1 << square_bit(where.y, where.x)
+
+
+    # Check if the given position is on the board and is occupied by a white piece
+    def isWhite(self, where):
+        return (self.white_men | self.white_kings) & self._bit(where) != 0
+
+
+    # Check if the given position is on the board and is occupied by a black piece
+    def isBlack(self, where):
+        return (self.black_men | self.black_kings) & self._bit(where) != 0
+
+
+    # Check if the given position is on the board and isn't occupied
+    def isEmpty(self, where):
+        if not self.on_board(where):
+            return False
+        return (self.white_men | self.white_kings | self.black_men | self.black_kings) & self._bit(where) == 0
+
+
+    # Check if the given position is on the board and is occupied by a king (of any player)
+    def isKing(self, where):
+        return (self.white_kings | self.black_kings) & self._bit(where) != 0
+
+
+    # Return the empty squares of the board
+    def _empty(self):
+        return VALID & ~(self.white_men | self.white_kings | self.black_men | self.black_kings)
+
+
+    # Check if the white player cannot make any move and therefore has just lost
+    def white_lost(self):
+        if self.white_men | self.white_kings == 0:
+            return True
+        return not self.capture_possible() and not self.normal_move_possible()
+
+
+    # Check if it is possible for the white player to capture an opponent's piece
+    def capture_possible(self):
+        empty = self._empty()
+        black = self.black_men | self.black_kings
+
+        # Men capture forward: a black piece one step ahead and an empty square just behind it
+        if forward_left(forward_left(self.white_men) & black) & empty:
+            return True
+        if forward_right(forward_right(self.white_men) & black) & empty:
+            return True
+
+        return kings_can_capture(self.white_kings, black, empty)
+
+
+    # Check if a non-capturing move is possible
+    def normal_move_possible(self):
+        empty = self._empty()
+        pieces = self.white_men | self.white_kings
+        if (forward_left(pieces) | forward_right(pieces)) & empty:
+            return True
+        return (backward_left(self.white_kings) | backward_right(self.white_kings)) & empty != 0
+
+
+    # Return a list of all the legal moves of the white player, in the same form as Board.legal_moves
+    # Moves are generated with shifts and masks of whole bitboards: the men which can capture, and the squares which men can
+    # step to, are found for all the men at once. Only kings and capture sequences are followed piece by piece
+    def legal_moves(self):
+        empty = self._empty()
+        black = self.black_men | self.black_kings
+        men = self.white_men
+        captures = []
+        # Men with a black piece one step forward and an empty square just behind it
+        capturing = men & (((black & (empty >> 5)) >> 5) | ((black & (empty >> 6)) >> 6))
+        while capturing:
+            piece = capturing & -capturing
+            self._man_captures(piece, black, empty, [piece], captures)
+            capturing ^= piece
+        # The kings are followed one by one only if one of them can capture
+        kings = self.white_kings if kings_can_capture(self.white_kings, black, empty) else 0
+        while kings:
+            piece = kings & -kings
+            self._king_captures(piece, black, empty, [piece], captures)
+            kings ^= piece
+        if captures:
+            return [[BIT_VALUE_POSITIONS[bit] for bit in path] for path in captures]
+
+        # A man steps one square diagonally forward: a square reached by << 5 is left by the man 5 bits lower
+        moves = []
+        for step in (5, 6):
+            targets = (men << step) & empty
+            while targets:
+                bit = targets & -targets
+                moves.append([BIT_VALUE_POSITIONS[bit >> step], BIT_VALUE_POSITIONS[bit]])
+                targets ^= bit
+        # A king slides any distance diagonally, until it meets another piece or the end of the board
+        kings = self.white_kings
+        while kings:
+            piece = kings & -kings
+            start = BIT_VALUE_POSITIONS[piece]
+            for step in (5, 6):
+                bit = piece << step & empty
+                while bit:
+                    moves.append([start, BIT_VALUE_POSITIONS[bit]])
+                    bit = bit << step & empty
+            for step in (6, 5):
+                bit = piece >> step & empty
+                while bit:
+                    moves.append([start, BIT_VALUE_POSITIONS[bit]])
+                    bit = bit >> step & empty
+            kings ^= piece
+        return moves
+
+
+    # Find all the capture sequences of a man standing on the single bit piece (see Board._man_captures)
+    # black and empty describe the board during the sequence: captured pieces are removed immediately
+    # The shifts of forward_left and the others are written out here. Shifted forward, a bit may leave the 55 used bits,
+    # but it never meets a black piece or an empty square there, so VALID isn't needed
+    def _man_captures(self, piece, black, empty, path, captures):
+        found = False
+        for step in (5, 6):
+            captured = piece << step & black
+            if captured and captured << step & empty:
+                found = True
+                bit = captured << step
+                path.append(bit)
+                self._man_captures(bit, black ^ captured, (empty | captured | piece) ^ bit, path, captures)
+                path.pop()
+        # Only the next captures of a sequence can go backward
+        if len(path) > 1:
+            for step in (6, 5):
+                captured = piece >> step & black
+                if captured and captured >> step & empty:
+                    found = True
+                    bit = captured >> step
+                    path.append(bit)
+                    self._man_captures(bit, black ^ captured, (empty | captured | piece) ^ bit, path, captures)
+                    path.pop()
+            if not found:
+                captures.append(list(path))
+
+
+    # Find all the capture sequences of a king standing on the single bit piece (see Board._king_captures)
+    # In every direction the king slides over empty squares to the first piece; if it's black, the king can land on any
+    # of the empty squares just behind it
+    def _king_captures(self, piece, black, empty, path, captures):
+        found = False
+        for step in (5, 6):
+            captured = piece << step
+            while captured & empty:
+                captured <<= step
+            if captured & black:
+                bit = captured << step & empty
+                while bit:
+                    found = True
+                    path.append(bit)
+                    self._king_captures(bit, black ^ captured, (empty | captured | piece) ^ bit, path, captures)
+                    path.pop()
+                    bit = bit << step & empty
+        for step in (6, 5):
+            captured = piece >> step
+            while captured & empty:
+                captured >>= step
+            if captured & black:
+                bit = captured >> step & empty
+                while bit:
+                    found = True
+                    path.append(bit)
+                    self._king_captures(bit, black ^ captured, (empty | captured | piece) ^ bit, path, captures)
+                    path.pop()
+                    bit = bit >> step & empty
+        if not found and len(path) > 1:
+            captures.append(list(path))
+
+
+    # Returns a safe copy of the board - we can edit it without changing the copied board
+    def copy(self):
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.white_men = self.white_men
+        new_board.white_kings = self.white_kings
+        new_board.black_men = self.black_men
+        new_board.black_kings = self.black_kings
+        new_board._keys = list(self._keys)
+        new_board._views = None
+        new_board.key_history = list(self.key_history)
+        new_board.undo_stack = []
+        return new_board
+
+
+    # Returns a new board, which is a copy of this board turned around and with all the pieces' colours reversed
+    def revert(self):
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.white_men = reverse_bits(self.black_men)
+        new_board.white_kings = reverse_bits(self.black_kings)
+        new_board.black_men = reverse_bits(self.white_men)
+        new_board.black_kings = reverse_bits(self.white_kings)
+        new_board._keys = [self._keys[1], self._keys[0]]
+        new_board._views = None
+        new_board.key_history = list(self.key_history)
+        new_board.undo_stack = []
+        return new_board
+
+
+    # Return a state of board after a move, exactly like Board.make_move does
+    def make_move(self, moves):
+        if len(moves) < 2:
+            raise ValueError("You have to move to a new position", self, moves)
+
+        new_board = self.copy()
+        must_capture = self.capture_possible()
+        for i in range(len(moves) - 1):
+            new_board._apply_single_move(moves[i], moves[i+1], must_capture=(i > 0 or must_capture), first_move=(i == 0))
+
+        # If a man ends its move on the end of a board, it is crowned
+        last = new_board._bit(moves[-1])
+        king_moved = new_board.white_kings & last
+        if new_board.white_men & last & WHITE_CROWN_ROW:
+            new_board.white_men ^= last
+            new_board.white_kings |= last
+            new_board._toggle_keys(last, True, False)
+            new_board._toggle_keys(last, True, True)
+
+        # Only a king's move without a capture can be taken back (see Board.make_move)
+        if king_moved and not must_capture:
+            new_board.key_history.append(self.key)
+        else:
+            new_board.key_history = []
+        return new_board.revert()
+
+
+    # Return a state of a board after making a single move from one position to another (i. e., a single capture or a single step)
+    def make_single_move(self, old, new, must_capture=False, first_move=True):
+        new_board = self.copy()
+        new_board._apply_single_move(old, new, must_capture, first_move)
+        return new_board
+
+
+    # Make a single move on this board, checking all the rules which Board.make_single_move checks
+    def _apply_single_move(self, old, new, must_capture, first_move):
+        moves_log = {
+            'move': [{'y': old.y, 'x': old.x}, {'y': new.y, 'x': new.x}],
+            'must_capture': must_capture, 'first_move': first_move}
+        if not self.isWhite(old):
+            raise ValueError("You have to move your own piece", self, moves_log)
+        if not self.isEmpty(new):
+            raise ValueError("You have to move to an empty field", self, moves_log)
+
+        old_bit = self._bit(old)
+        new_bit = self._bit(new)
+        king = self.white_kings & old_bit != 0
+        dy = new.y - old.y
+        dx = new.x - old.x
+        yi = (dy > 0) - (dy < 0)
+        xi = (dx > 0) - (dx < 0)
+
+        if must_capture:
+            if not king:
+                if abs(dy) != 2 or abs(dx) != 2 or (first_move and dy != 2):
+                    raise ValueError("You have to capture", self, moves_log)
+                middle = self._bit(old.middle(new))
+                if not (self.black_men | self.black_kings) & middle:
+                    raise ValueError("You have to capture an enemy", self, moves_log)
+                captured = middle
+            else:
+                if abs(dy) != abs(dx):
+                    raise ValueError("You cannot move there - too far", self, moves_log)
+
+                # Check if there is a black piece which was captured
+                captured = 0
+                where = old.add(yi, xi)
+                while where.y != new.y:
+                    if self.isBlack(where):
+                        captured |= self._bit(where)
+                        if not self.isEmpty(where.add(yi, xi)):
+                            raise ValueError("You cannot capture more than one piece at one!", self, moves_log)
+                    if self.isWhite(where):
+                        raise ValueError("You cannot move over your own piece!", self, moves_log)
+                    where = where.add(yi, xi)
+
+                if captured == 0:
+                    raise ValueError("You have to capture an enemy's piece", self, moves_log)
+
+            self._toggle_keys(self.black_men & captured, False, False)
+            self._toggle_keys(self.black_kings & captured, False, True)
+            self.black_men &= ~captured
+            self.black_kings &= ~captured
+
+        else:
+            if not king:
+                if dy != 1 or abs(dx) != 1:
+                    raise ValueError("The position is inaccessible for this piece", self, moves_log)
+            else:
+                if abs(dy) != abs(dx):
+                    raise ValueError("You can only move diagonally", self, moves_log)
+
+                where = old.add(yi, xi)
+                while where.y != new.y:
+                    if not self.isEmpty(where):
+                        raise ValueError("You cannot move over this square", self, moves_log)
+                    where = where.add(yi, xi)
+
+        # Move the white piece
+        self._toggle_keys(old_bit | new_bit, True, king)
+        if king:
+            self.white_kings ^= old_bit | new_bit
+        else:
+            self.white_men ^= old_bit | new_bit
+        self._views = None
+
+
+    # Make a move in place and remember how to take it back with pop (see Board.push)
+    # The move isn't checked, so it should be one of legal_moves()
+    def push(self, move):
+        history = self.key_history
+        key, mirrored = self._keys
+        self.undo_stack.append((self.white_men, self.white_kings, self.black_men, self.black_kings, self._keys,
+                                history, len(history)))
+        start_bit = square_bit(move[0].y, move[0].x)
+        end_bit = square_bit(move[-1].y, move[-1].x)
+        start = 1 << start_bit
+        end = 1 << end_bit
+
+        # Every piece between two consecutive points of a legal move is captured: walk from one point to the next with
+        # the shift of their direction
+        captured = 0
+        for i in range(len(move) - 1):
+            old, new = move[i], move[i+1]
+            bit = 1 << square_bit(old.y, old.x)
+            target = 1 << square_bit(new.y, new.x)
+            if new.y > old.y:
+                step = 5 if new.x < old.x else 6
+                bit <<= step
+                while bit != target:
+                    captured |= bit
+                    bit <<= step
+            else:
+                step = 6 if new.x < old.x else 5
+                bit >>= step
+                while bit != target:
+                    captured |= bit
+                    bit >>= step
+        black_men = self.black_men & ~captured
+        black_kings = self.black_kings & ~captured
+        for numbers, mirror, bits in ((BIT_ZOBRIST[0][0], BIT_MIRRORED[0][0], self.black_men & captured),
+                                      (BIT_ZOBRIST[0][1], BIT_MIRRORED[0][1], self.black_kings & captured)):
+            while bits:
+                low = bits & -bits
+                b = low.bit_length() - 1
+                key ^= numbers[b]
+                mirrored ^= mirror[b]
+                bits ^= low
+
+        # The history goes on after a king's move without a capture and starts again after any other move (see Board.push)
+        king = self.white_kings & start != 0
+        if king and not captured & (self.black_men | self.black_kings):
+            history.append(self._keys[0])
+        else:
+            self.key_history = []
+
+        # The piece moves, and a man which ends its move on the last row is crowned
+        crowned = king or end & WHITE_CROWN_ROW != 0
+        key ^= BIT_ZOBRIST[1][king][start_bit] ^ BIT_ZOBRIST[1][crowned][end_bit]
+        mirrored ^= BIT_MIRRORED[1][king][start_bit] ^ BIT_MIRRORED[1][crowned][end_bit]
+        white_men = self.white_men & ~start
+        white_kings = self.white_kings & ~start
+        if crowned:
+            white_kings |= end
+        else:
+            white_men |= end
+
+        # Turn the board around, so that the player who moves next is white
+        self.white_men = reverse_bits(black_men)
+        self.white_kings = reverse_bits(black_kings)
+        self.black_men = reverse_bits(white_men)
+        self.black_kings = reverse_bits(white_kings)
+        self._keys = [mirrored, key]
+        self._views = None
+
+
+    # Take back the last move made with push
+    def pop(self):
+        self.white_men, self.white_kings, self.black_men, self.black_kings, keys, history, length = self.undo_stack.pop()
+        self._keys = keys
+        del history[length:]
+        self.key_history = history
+        self._views = None
+
+
+    # Display the board
+    def show(self, black_moves = False):
+        from Renderer import show
+        show(self, black_moves)
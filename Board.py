@@ -1,12 +1,6 @@
-import math
-import copy
-import numpy as np
-from PIL import Image, ImageColor
-import IPython.display
-
 from Piece import Piece
-from Position import Position
-from Graphics import draw_circle
+from Position import POSITIONS
+from Zobrist import ZOBRIST, MIRRORED
 
 
 # The Board class keeps the state of the game at a given time. It's most important fields are: whites (a list of all the white pawns on the board), blacks (a list of all the black pawns on the board), world (a two-dimentional list, representing the board. Each field is either null (if there is no piece standing there) or it points to a piece which stands at a given place).
@@ -15,20 +9,213 @@ from Graphics import draw_circle
 # White is the player, who moves next (this makes implementation easier: we don't have to 'if' everywhere whose move it is)
 # Rows are represented by 'y' axis, columns by 'x' axis. Both are indexed from 0 to 9. (0, 0) is the left-upper square
 
+# Internally the board doesn't turn around after every move. The pieces are kept in the coordinates and colours of the player
+# who moved first (in _whites, _blacks and _world), and the flag flipped tells if the board is currently seen from the
+# other side. Positions given to and returned by the board's functions are translated at the boundary, so from the outside
+# the board looks exactly as if it was turned around: white moves next and moves towards larger y.
+# whites, blacks and world are built from the internal lists only when somebody asks for them (and only if the board is
+# flipped - otherwise they are just the internal lists). When the board is flipped, they are read-only.
+
+# Every board also keeps its Zobrist key (see Zobrist.py) up to date after every change. To make turning the board around
+# free, two keys are kept: one for the board as it is and one for the board turned around, and key returns the right one.
+
+# Boards also keep running sums of the features which evaluation functions use most (see features), updated with every
+# piece which is added, removed, moved or crowned, so that evaluating a position doesn't have to go over all the pieces.
+# And they remember the keys of the earlier positions since the last move which can't be taken back (see key_history),
+# so that repeated positions can be found.
+
+
+# The four diagonal directions, as (dy, dx) pairs. The first two go forward (towards larger y), the last two go backward
+DIRECTIONS = [(1, -1), (1, 1), (-1, -1), (-1, 1)]
+
+# Precomputed diagonal rays: RAYS[y][x][d] is the list of squares (as (y, x) tuples) which we meet when going
+# from (y, x) in the direction DIRECTIONS[d], in order, until we reach the end of the board
+RAYS = [[[[(y + dy * i, x + dx * i) for i in range(1, 10) if 0 <= y + dy * i < 10 and 0 <= x + dx * i < 10]
+          for (dy, dx) in DIRECTIONS]
+         for x in range(10)]
+        for y in range(10)]
+
+# The 50 dark squares (the only ones where pieces can stand), numbered row by row: SQUARES[i] is the square (y, x) number i
+# The number of a dark square (y, x) is 5 * y + x // 2, and turning the board around changes number i into 49 - i
+SQUARES = [(y, x) for y in range(10) for x in range(y % 2, 10, 2)]
+
+# Codes of the squares used by serialize: one byte per dark square
+EMPTY = 0
+WHITE_MAN = 1
+WHITE_KING = 2
+BLACK_MAN = 3
+BLACK_KING = 4
+
+# The shared Positions of the squares (see Position.POSITIONS), indexed by the number 10 * y + x of a square in the
+# internal coordinates, as seen by the player who moves next: SQUARE_POSITIONS[flipped][10 * y + x]
+SQUARE_POSITIONS = {False: POSITIONS, True: POSITIONS[::-1]}
+
+# Indices of the features returned by features: the number of men, the number of kings, the advancement of the men (the
+# sum of the rows they have advanced from their back row) and the sum of the piece-square values of the pieces (see
+# PIECE_SQUARE), first of the player who moves next, then (from OPPONENT on) of the other player
+MEN, KINGS, ADVANCEMENT, PLACEMENT = range(4)
+OPPONENT = 4
+
+# Piece-square values: PIECE_SQUARE[king][y][x] for a piece at (y, x) as seen by its owner (moving towards larger y)
+# Men are worth a bit more on the back row, where they keep the opponent's men from being crowned, and in the centre;
+# kings on long diagonals (a king is worth the number of squares it could reach on an empty board)
+# These are also the default tables of Encoding.BatchEvaluator
+PIECE_SQUARE = [[[(4 if y == 0 else 0) + (3 if 2 <= x <= 7 else 0) for x in range(10)] for y in range(10)],
+                [[sum(len(ray) for ray in RAYS[y][x]) for x in range(10)] for y in range(10)]]
+
+# The piece-square values of a piece in the internal coordinates: _PLACEMENT[white][king][y][x]
+_PLACEMENT = [[[[PIECE_SQUARE[king][y if white else 9 - y][x if white else 9 - x] for x in range(10)] for y in range(10)]
+               for king in range(2)] for white in range(2)]
+
+# Indices of the forward directions in DIRECTIONS of the player who moves next, depending on whether the board is flipped
+FORWARD = {False: (0, 1), True: (2, 3)}
+
+
+# Remove a piece from a list of pieces (see Piece.index) without searching it: the last piece of the list takes its place
+def _remove(pieces, piece):
+    last = pieces.pop()
+    if last is not piece:
+        pieces[piece.index] = last
+        last.index = piece.index
+
+
+# Put a piece removed with _remove back in its place. Pieces removed one after another have to be put back in the reverse
+# order, and then the list is exactly as it was before
+def _restore(pieces, piece):
+    if piece.index == len(pieces):
+        pieces.append(piece)
+    else:
+        moved = pieces[piece.index]
+        moved.index = len(pieces)
+        pieces.append(moved)
+        pieces[piece.index] = piece
+
 
 class Board:
-    # Create a new white piece at position (y, x) and add it to the whites list
+    # Create a new white piece at position (y, x) and add it to the board
     def newWhite(self, y, x, king=False):
-        white = Piece.whitePiece(y, x, king)
-        self.whites += [white]
-        return white
+        if self.flipped:
+            return self._add(Piece.blackPiece(9 - y, 9 - x, king))
+        return self._add(Piece.whitePiece(y, x, king))
     
     
-    # Create a new black piece at position (y, x) and add it to the whites list
+    # Create a new black piece at position (y, x) and add it to the board
     def newBlack(self, y, x, king=False):
-        black = Piece.blackPiece(y, x, king)
-        self.blacks += [black]
-        return black
+        if self.flipped:
+            return self._add(Piece.whitePiece(9 - y, 9 - x, king))
+        return self._add(Piece.blackPiece(y, x, king))
+
+
+    # Add a piece (given in the internal coordinates and colours) to the internal lists and the internal world
+    def _add(self, piece):
+        pieces = self._whites if piece.white else self._blacks
+        piece.index = len(pieces)
+        pieces += [piece]
+        self._world[piece.y][piece.x] = piece
+        self._toggle_key(piece)
+        self._count(piece, 1)
+        self._views = None
+        return piece
+
+
+    # Add or remove the numbers of a piece (given in the internal coordinates) from the keys of the board
+    def _toggle_key(self, piece):
+        self._keys[0] ^= ZOBRIST[piece.white][piece.king][piece.y][piece.x]
+        self._keys[1] ^= MIRRORED[piece.white][piece.king][piece.y][piece.x]
+
+
+    # Add (sign 1) or remove (sign -1) a piece (given in the internal coordinates) from the sums of the features
+    def _count(self, piece, sign):
+        features = self._features
+        base = 0 if piece.white else OPPONENT
+        if piece.king:
+            features[base + KINGS] += sign
+        else:
+            features[base + MEN] += sign
+            features[base + ADVANCEMENT] += sign * (piece.y if piece.white else 9 - piece.y)
+        features[base + PLACEMENT] += sign * _PLACEMENT[piece.white][piece.king][piece.y][piece.x]
+
+
+    # The features of the position (see MEN, KINGS, ADVANCEMENT, PLACEMENT and OPPONENT) as a tuple of 8 numbers: 4 of the
+    # player who moves next and 4 of the other player. They are kept up to date, so this doesn't look at the pieces
+    def features(self):
+        features = self._features
+        if self.flipped:
+            return tuple(features[OPPONENT:] + features[:OPPONENT])
+        return tuple(features)
+
+
+    # How many times the position occurred before in the game (with the same player to move), counting back to the last
+    # move which can't be taken back: a move of a man or a capture. Only kings' moves can repeat a position
+    def repetitions(self):
+        return self.key_history[-2::-2].count(self.key)
+
+
+    # The Zobrist key of the position, as seen by the player who moves next
+    @property
+    def key(self):
+        return self._keys[self.flipped]
+
+
+    # The list of the pieces of the player who moves next
+    @property
+    def whites(self):
+        if not self.flipped:
+            return self._whites
+        return (self._views or self._build_views())[0]
+
+
+    # The list of the pieces of the other player
+    @property
+    def blacks(self):
+        if not self.flipped:
+            return self._blacks
+        return (self._views or self._build_views())[1]
+
+
+    # The two-dimensional list representing the board, as seen by the player who moves next
+    @property
+    def world(self):
+        if not self.flipped:
+            return self._world
+        return (self._views or self._build_views())[2]
+
+
+    # Build the turned around copies of whites, blacks and world. They are kept until the board changes
+    def _build_views(self):
+        world = [[None for x in range(10)] for y in range(10)]
+        whites = []
+        for piece in self._blacks:
+            world[9 - piece.y][9 - piece.x] = Piece.whitePiece(9 - piece.y, 9 - piece.x, piece.king)
+            whites += [world[9 - piece.y][9 - piece.x]]
+        blacks = []
+        for piece in self._whites:
+            world[9 - piece.y][9 - piece.x] = Piece.blackPiece(9 - piece.y, 9 - piece.x, piece.king)
+            blacks += [world[9 - piece.y][9 - piece.x]]
+        self._views = (whites, blacks, world)
+        return self._views
+
+
+    # The internal lists of pieces of the player who moves next and of the other player
+    def _own(self):
+        return self._blacks if self.flipped else self._whites
+
+    def _opponent(self):
+        return self._whites if self.flipped else self._blacks
+
+
+    # Return the piece standing on the square (y, x) given in the coordinates of the player who moves next (or None)
+    def _piece(self, y, x):
+        if self.flipped:
+            return self._world[9 - y][9 - x]
+        return self._world[y][x]
+
+
+    # Translate a square between the internal coordinates and the coordinates of the player who moves next (both ways)
+    def _translate(self, y, x):
+        if self.flipped:
+            return 9 - y, 9 - x
+        return y, x
     
     
     # Check if a Position where is on the board
@@ -42,32 +229,42 @@ class Board:
         if not self.on_board(where):
             return False
         # Check, if the Position where is occupied by any piece
-        if self.world[where.y][where.x] is None:
+        piece = self._piece(where.y, where.x)
+        if piece is None:
             return False
-        # Check, if the Position is occupied by a white piece
-        return self.world[where.y][where.x].white
+        # Check, if the Position is occupied by a piece of the player who moves next
+        return piece.white != self.flipped
     
     
     # Check if the given position is on the board and is occupied by a black piece
     def isBlack(self, where):
         if not self.on_board(where):
             return False
-        if self.world[where.y][where.x] is None:
+        piece = self._piece(where.y, where.x)
+        if piece is None:
             return False
-        return not self.world[where.y][where.x].white
+        return piece.white == self.flipped
     
     
     # Check if the given position is on the board and isn't occupied
     def isEmpty(self, where):
         if not self.on_board(where):
             return False
-        return self.world[where.y][where.x] is None
+        return self._piece(where.y, where.x) is None
+
+
+    # Check if the given position is on the board and is occupied by a king (of any player)
+    def isKing(self, where):
+        if not self.on_board(where):
+            return False
+        piece = self._piece(where.y, where.x)
+        return piece is not None and piece.king
     
     
     # Check if the white player cannot make any move and therefore has just lost
     def white_lost(self):
         # If white has no pieces left, they cannot make any move and so have lost
-        if len(self.whites) == 0:
+        if len(self._own()) == 0:
             return True
      
         # If white can capture an opponents piece, they can make a move and so haven't lost yet
@@ -81,74 +278,212 @@ class Board:
     
     # Check if it is possible for the white player to capture an opponent's piece
     def capture_possible(self):
+        world = self._world
+        mine = not self.flipped
+        forward = FORWARD[self.flipped]
         # Iterate over all the white pieces
-        for white in self.whites:
+        for white in self._own():
+            rays = RAYS[white.y][white.x]
             # Consider different cases, depending on wether a piece is a king or not
             if not white.king:
-                for i in [-1, 1]:
-                    if self.isBlack(white.position().add(1, i)):
-                        if self.isEmpty(white.position().add(2, 2*i)):
+                for d in forward:
+                    ray = rays[d]
+                    if len(ray) >= 2:
+                        captured = world[ray[0][0]][ray[0][1]]
+                        if captured is not None and captured.white != mine and world[ray[1][0]][ray[1][1]] is None:
                             return True
             else:
                 # Iterate over possible directions of movement
-                for xi in [-1, 1]:
-                    for yi in [-1, 1]:
-                        where = white.position().add(yi, xi)
-                        # Go in that direction, until an occuppied field is found or we reach the end of the board
-                        while (self.isEmpty(where)):
-                            where = where.add(yi, xi)
-                        if self.isBlack(where) and self.isEmpty(where.add(yi, xi)):
+                for ray in rays:
+                    # Go in that direction, until an occuppied field is found or we reach the end of the board
+                    i = 0
+                    while i < len(ray) and world[ray[i][0]][ray[i][1]] is None:
+                        i += 1
+                    if i + 1 < len(ray):
+                        captured = world[ray[i][0]][ray[i][1]]
+                        if captured.white != mine and world[ray[i+1][0]][ray[i+1][1]] is None:
                             return True
         return False
     
     
     # Check if a non-capturing move is possible
     def normal_move_possible(self):
+        world = self._world
+        forward = FORWARD[self.flipped]
         # Iterate over all the white pieces
-        for white in self.whites:
-            for i in [-1, 1]:
+        for white in self._own():
+            rays = RAYS[white.y][white.x]
+            for d in range(4):
                 # If a piece is a man, check only if a forward-left or forward-right field is empty
-                if self.isEmpty(white.position().add(1, i)):
-                    return True
                 # If it's a king, check also if a backward-left or backward-right field is empty
-                if white.king and self.isEmpty(white.position().add(-1, i)):
+                if (white.king or d in forward) and rays[d] and world[rays[d][0][0]][rays[d][0][1]] is None:
                     return True
         return False
     
     
+    # Return a list of all the legal moves of the white player. Each move is a list of Positions, exactly as make_move expects it
+    # If any capture is possible, only capturing moves are returned (capturing is mandatory). A capturing piece continues
+    # capturing as long as it can from the square it has landed on, so every capture sequence is returned in its full length
+    def legal_moves(self):
+        world = self._world
+        captures = []
+        for white in self._own():
+            if white.king:
+                self._king_captures(world, white.y, white.x, [(white.y, white.x)], captures)
+            else:
+                self._man_captures(world, white.y, white.x, [(white.y, white.x)], captures)
+        positions = SQUARE_POSITIONS[self.flipped]
+        if captures:
+            return [[positions[10 * y + x] for (y, x) in path] for path in captures]
+
+        moves = []
+        forward = FORWARD[self.flipped]
+        for white in self._own():
+            start = positions[10 * white.y + white.x]
+            rays = RAYS[white.y][white.x]
+            if not white.king:
+                # A man steps one square diagonally forward
+                for d in forward:
+                    ray = rays[d]
+                    if ray and world[ray[0][0]][ray[0][1]] is None:
+                        moves += [[start, positions[10 * ray[0][0] + ray[0][1]]]]
+            else:
+                # A king slides any distance diagonally, until it meets another piece or the end of the board
+                for ray in rays:
+                    for (y, x) in ray:
+                        if world[y][x] is not None:
+                            break
+                        moves += [[start, positions[10 * y + x]]]
+        return moves
+
+
+    # Find all the capture sequences of a man standing at (y, x), which has already visited the squares in path
+    # (all in the internal coordinates). The first capture has to be made forward, the next ones can go backward as well.
+    # The captured pieces are removed from the world immediately (just like make_single_move does), so no piece can be
+    # captured twice. Complete sequences are appended to captures; world is restored before returning
+    def _man_captures(self, world, y, x, path, captures):
+        piece = world[y][x]
+        forward = FORWARD[self.flipped]
+        found = False
+        for d, ray in enumerate(RAYS[y][x]):
+            if (len(path) == 1 and d not in forward) or len(ray) < 2:
+                continue
+            (my, mx), (ny, nx) = ray[0], ray[1]
+            captured = world[my][mx]
+            if captured is None or captured.white == piece.white or world[ny][nx] is not None:
+                continue
+
+            found = True
+            world[my][mx], world[y][x], world[ny][nx] = None, None, piece
+            path.append((ny, nx))
+            self._man_captures(world, ny, nx, path, captures)
+            path.pop()
+            world[my][mx], world[y][x], world[ny][nx] = captured, piece, None
+
+        if not found and len(path) > 1:
+            captures.append(list(path))
+
+
+    # Find all the capture sequences of a king standing at (y, x), which has already visited the squares in path
+    # A king captures the first opponent's piece it meets on a diagonal (if the square just behind it is empty) and may land
+    # on any empty square behind it
+    def _king_captures(self, world, y, x, path, captures):
+        piece = world[y][x]
+        found = False
+        for ray in RAYS[y][x]:
+            # Go in that direction, until an occupied field is found or we reach the end of the board
+            i = 0
+            while i < len(ray) and world[ray[i][0]][ray[i][1]] is None:
+                i += 1
+            if i + 1 >= len(ray):
+                continue
+            my, mx = ray[i]
+            captured = world[my][mx]
+            if captured.white == piece.white:
+                continue
+            landings = []
+            i += 1
+            while i < len(ray) and world[ray[i][0]][ray[i][1]] is None:
+                landings.append(ray[i])
+                i += 1
+            if not landings:
+                continue
+
+            found = True
+            world[my][mx], world[y][x] = None, None
+            for (ny, nx) in landings:
+                world[ny][nx] = piece
+                path.append((ny, nx))
+                self._king_captures(world, ny, nx, path, captures)
+                path.pop()
+                world[ny][nx] = None
+            world[my][mx], world[y][x] = captured, piece
+
+        if not found and len(path) > 1:
+            captures.append(list(path))
+
+
     # Initializes the board to a starting configuration
     def __init__(self):
-        self.whites = []
-        self.blacks = []
+        self._whites = []
+        self._blacks = []
+        self._world = [[None for x in range(10)] for y in range(10)]
+        self._views = None
+        self._keys = [0, 0]
+        self._features = [0] * 8
+        self.flipped = False
+        # The keys of the earlier positions (see repetitions), the oldest first
+        self.key_history = []
         # Create white and black pieces on appropriate positions and add them to the board's world
-        self.world = [[(self.newWhite(y, x) if y < 3 else self.newBlack(y, x))
-                           if ((x + y) % 2 == 0 and (y < 3 or y > 6)) else None 
-                    for x in range(10)]
-                    for y in range(10)]
+        for y in range(10):
+            for x in range(10):
+                if (x + y) % 2 == 0 and (y < 3 or y > 6):
+                    self._add(Piece(y < 3, False, y, x))
+        # The stack of moves made in place with push, which pop can take back
+        self.undo_stack = []
     
     
     # Initializes an empty board (with no pieces on it)
     @staticmethod
     def empty_board():
-        to_return = Board()
-        to_return.whites = []
-        to_return.blacks = []
-        to_return.world = [[None for x in range(10)] for y in range(10)]
+        to_return = Board.__new__(Board)
+        to_return._whites = []
+        to_return._blacks = []
+        to_return._world = [[None for x in range(10)] for y in range(10)]
+        to_return._views = None
+        to_return._keys = [0, 0]
+        to_return._features = [0] * 8
+        to_return.flipped = False
+        to_return.key_history = []
+        to_return.undo_stack = []
         return to_return
     
     
     # Returns a safe copy of the board - we can edit it without changing the copied board
+    # The pieces are copied straight into the new lists and world, and the keys and the features are copied instead of being
+    # computed again
     def copy(self):
-        new_board = Board.empty_board()
-        new_board.whites = []
-        new_board.blacks = []
-        
-        for white in self.whites:
-            new_board.world[white.y][white.x] = new_board.newWhite(white.y, white.x, white.king)
-            
-        for black in self.blacks:
-            new_board.world[black.y][black.x] = new_board.newBlack(black.y, black.x, black.king)
-            
+        new_board = Board.__new__(Board)
+        world = [[None] * 10 for y in range(10)]
+        whites = []
+        for white in self._whites:
+            piece = Piece(True, white.king, white.y, white.x, white.index)
+            world[white.y][white.x] = piece
+            whites.append(piece)
+        blacks = []
+        for black in self._blacks:
+            piece = Piece(False, black.king, black.y, black.x, black.index)
+            world[black.y][black.x] = piece
+            blacks.append(piece)
+        new_board._whites = whites
+        new_board._blacks = blacks
+        new_board._world = world
+        new_board._views = None
+        new_board._keys = list(self._keys)
+        new_board._features = list(self._features)
+        new_board.flipped = self.flipped
+        new_board.key_history = list(self.key_history)
+        new_board.undo_stack = []
         return new_board
         
         
@@ -157,23 +492,14 @@ class Board:
     # internal representation the player who is about to move is always white
     def revert(self):
         new_board = self.copy()
-        
-        # First, swap the lists of white and black colours
-        new_board.whites, new_board.blacks = new_board.blacks, new_board.whites
-        # Then change a colour of each piece
-        for piece in new_board.whites + new_board.blacks:
-            piece.changeColour()
-
-        # Move each piece symmetrically across the board
-        # First, change each piece's position
-        for piece in new_board.whites + new_board.blacks:
-            piece.move_symmetrically()
-        # Now modify the world accordingly, so that each piece is kept in board at its correct position
-        for x in range(10):
-            for y in range(5):
-                new_board.world[y][x], new_board.world[9 - y][9 - x] = new_board.world[9 - y][9 - x], new_board.world[y][x]
-
+        new_board._turn_around()
         return new_board
+
+
+    # Turn this board around in place and reverse the colours of all the pieces. Only the flag changes
+    def _turn_around(self):
+        self.flipped = not self.flipped
+        self._views = None
         
         
     # Return a state of board after a move. Notice that we don't change the state of this board, but return a new board which shows how it will look like after makinhg a move
@@ -182,31 +508,43 @@ class Board:
         if len(moves) < 2:
             raise ValueError("You have to move to a new position", self, moves)
             
+        # The board is copied only once, all the single moves are then made on the copy
         new_board = self.copy()
+        must_capture = self.capture_possible()
         for i in range(len(moves) - 1):
-            try:
-                new_board = new_board.make_single_move(
-                    moves[i], moves[i+1],
-                    must_capture=(i > 0 or self.capture_possible()), first_move=(i == 0))
-            except ValueError as ve:
-                raise ve
+            new_board._apply_single_move(moves[i], moves[i+1], must_capture=(i > 0 or must_capture), first_move=(i == 0))
 
         # If a piece ends its move on the end of a board, it is crowned
-        piece = new_board.world[moves[-1].y][moves[-1].x]
-        if piece.y == 9:
+        piece = new_board._piece(moves[-1].y, moves[-1].x)
+        king_moved = piece.king
+        if moves[-1].y == 9:
+            new_board._toggle_key(piece)
+            new_board._count(piece, -1)
             piece.king = True
+            new_board._toggle_key(piece)
+            new_board._count(piece, 1)
+
+        # Only a king's move without a capture can be taken back; after any other move no earlier position can come again
+        if king_moved and not must_capture:
+            new_board.key_history.append(self.key)
+        else:
+            new_board.key_history = []
 
         # Inverting board at the end of a move, so that the player who moves is white in Board's internal representation
-        return new_board.revert()
+        new_board._turn_around()
+        return new_board
         
     
     # Return a state of a board after making a single move from one position to another (i. e., a single capture or a single step)
     def make_single_move(self, old, new, must_capture=False, first_move=True):
         new_board = self.copy()
-        piece = new_board.world[old.y][old.x]
-        yi = np.sign(new.y - old.y)
-        xi = np.sign(new.x - old.x)
-        
+        new_board._apply_single_move(old, new, must_capture, first_move)
+        return new_board
+
+
+    # Make a single move on this board in place. All the rules are checked before the board is changed,
+    # so if the move isn't allowed, a ValueError is raised and the board stays as it was
+    def _apply_single_move(self, old, new, must_capture, first_move):
         moves_log = {
             'move': [{'y': old.y, 'x': old.x}, {'y': new.y, 'x': new.x}],
             'must_capture': must_capture, 'first_move': first_move}
@@ -215,25 +553,21 @@ class Board:
         if not self.isEmpty(new):
             raise ValueError("You have to move to an empty field", self, moves_log)
         
+        piece = self._piece(old.y, old.x)
+        yi = (new.y > old.y) - (new.y < old.y)
+        xi = (new.x > old.x) - (new.x < old.x)
         
         if must_capture:
             if not piece.king:
                 if abs(new.y - old.y) != 2 or abs(new.x - old.x) != 2 or (first_move and new.y - old.y != 2):
-                    print(self.capture_possible())
                     raise ValueError("You have to capture", self, moves_log)
                 if not self.isBlack(old.middle(new)):
                     raise ValueError("You have to capture an enemy", self, moves_log)
-
-                # Update the new_board after this move - remove the captured black piece
-                for black in new_board.blacks:
-                    if black.y == old.middle(new).y and black.x == old.middle(new).x:
-                        new_board.blacks.remove(black)
-                        break
-                new_board.world[old.middle(new).y][old.middle(new).x] = None
+                captured = [old.middle(new)]
                 
             else:
                 if abs(new.y - old.y) != abs(new.x - old.x):
-                    raise ValueError("You cannot move there - too far", self, moves)
+                    raise ValueError("You cannot move there - too far", self, moves_log)
                 
                 # Check if there is a black piece which was captured
                 where = old.add(yi, xi)
@@ -250,13 +584,13 @@ class Board:
                 if len(captured) == 0:
                     raise ValueError("You have to capture an enemy's piece", self, moves_log)
                 
-                # Update the new_board after this move - remove the captured black piece
-                for captured_position in captured:
-                    for black in new_board.blacks:
-                        if black.y == captured_position.y and black.x == captured_position.x:
-                            new_board.blacks.remove(black)
-                            break
-                    new_board.world[captured_position.y][captured_position.x] = None
+            # Update the board after this move - remove the captured black pieces
+            for captured_position in captured:
+                black = self._piece(captured_position.y, captured_position.x)
+                _remove(self._opponent(), black)
+                self._world[black.y][black.x] = None
+                self._toggle_key(black)
+                self._count(black, -1)
                 
         else:
             if not piece.king:
@@ -276,48 +610,123 @@ class Board:
                     raise ValueError("You cannot move to this square", self, moves_log)
         
         
-        # Update the new_board after this move - change the position of the white piece who moved
-        for white in new_board.whites:
-            if white.y == old.y and white.x == old.x:
-                white.x = new.x
-                white.y = new.y
-        new_board.world[new.y][new.x] = new_board.world[old.y][old.x]
-        new_board.world[old.y][old.x] = None
-        
-        return new_board
+        # Update the board after this move - change the position of the white piece who moved
+        self._world[piece.y][piece.x] = None
+        self._toggle_key(piece)
+        self._count(piece, -1)
+        piece.y, piece.x = self._translate(new.y, new.x)
+        self._world[piece.y][piece.x] = piece
+        self._toggle_key(piece)
+        self._count(piece, 1)
+        self._views = None
+
+
+    # Return the position as 50 bytes, one per dark square (see SQUARES), as seen by the player who moves next
+    # This is a compact form of the board which is cheap to send to other processes or to store
+    def serialize(self):
+        data = bytearray(50)
+        for piece in self._whites + self._blacks:
+            index = 5 * piece.y + piece.x // 2
+            if self.flipped:
+                index = 49 - index
+            data[index] = (WHITE_MAN if piece.white != self.flipped else BLACK_MAN) + piece.king
+        return bytes(data)
+
+
+    # Create a board from the result of serialize
+    @staticmethod
+    def deserialize(data):
+        board = Board.empty_board()
+        for index in range(50):
+            if data[index] != EMPTY:
+                y, x = SQUARES[index]
+                if data[index] <= WHITE_KING:
+                    board.newWhite(y, x, data[index] == WHITE_KING)
+                else:
+                    board.newBlack(y, x, data[index] == BLACK_KING)
+        return board
+
+
+    # Make a move in place, without copying the board, and remember how to take it back with pop
+    # This is meant for searching a game tree: the move isn't checked, so it should be one of legal_moves()
+    # Just like after make_move, the board is turned around afterwards, so that the player who moves next is white
+    def push(self, move):
+        world = self._world
+        flipped = self.flipped
+        start_y, start_x = self._translate(move[0].y, move[0].x)
+        piece = world[start_y][start_x]
+        world[start_y][start_x] = None
+        keys = tuple(self._keys)
+        features = tuple(self._features)
+        history = self.key_history
+        self._toggle_key(piece)
+        self._count(piece, -1)
+        captured = []
+        opponent = self._opponent()
+        for i in range(len(move) - 1):
+            old, new = move[i], move[i+1]
+            yi = 1 if new.y > old.y else -1
+            xi = 1 if new.x > old.x else -1
+            if flipped:
+                yi, xi = -yi, -xi
+            # Every piece between two consecutive points of a legal move is captured
+            y, x = self._translate(old.y, old.x)
+            end_y = 9 - new.y if flipped else new.y
+            y, x = y + yi, x + xi
+            while y != end_y:
+                black = world[y][x]
+                if black is not None:
+                    _remove(opponent, black)
+                    captured += [black]
+                    world[y][x] = None
+                    self._toggle_key(black)
+                    self._count(black, -1)
+                y, x = y + yi, x + xi
+
+        end_y, end_x = self._translate(move[-1].y, move[-1].x)
+        world[end_y][end_x] = piece
+        piece.y = end_y
+        piece.x = end_x
+        crowned = not piece.king and move[-1].y == 9
+        if crowned:
+            piece.king = True
+        self._toggle_key(piece)
+        self._count(piece, 1)
+
+        # The history is extended in place after a king's move without a capture (pop cuts it back to its length),
+        # and started again after any other move
+        self.undo_stack.append((piece, start_y, start_x, captured, crowned, keys, features, history, len(history)))
+        if piece.king and not crowned and not captured:
+            history.append(keys[flipped])
+        else:
+            self.key_history = []
+        self._turn_around()
+
+
+    # Take back the last move made with push, restoring the board exactly as it was before it
+    def pop(self):
+        self._turn_around()
+        piece, y, x, captured, crowned, keys, features, history, length = self.undo_stack.pop()
+        self._keys = list(keys)
+        self._features = list(features)
+        del history[length:]
+        self.key_history = history
+        self._world[piece.y][piece.x] = None
+        piece.y = y
+        piece.x = x
+        self._world[y][x] = piece
+        if crowned:
+            piece.king = False
+        # Put the captured pieces back in their places, also in the list of the opponent's pieces
+        opponent = self._opponent()
+        for black in reversed(captured):
+            _restore(opponent, black)
+            self._world[black.y][black.x] = black
     
     
-    # Display the board
+    # Display the board (see Renderer.py)
+    # If black_moves is true, the board is drawn turned around
+    # The drawing libraries are imported only here, so that playing games without drawing them doesn't need them
     def show(self, black_moves = False):
-        if black_moves:
-            self.revert().show()
-            return
-        
-        white = (200, 255, 200)
-        black = (0, 100, 0)
-        
-        size = 40
-        img = Image.new("RGB", (10 * size, 10 * size))
-        
-        arr = np.array(img)
-        arr[:] = (255, 255, 255)
-
-        indices = np.arange(10)
-        col_num = np.repeat(indices, size)
-        col_num = np.tile(col_num, (size*10, 1))
-        row_num = np.transpose(col_num)
-        is_black = (col_num + row_num) % 2 == 0
-        arr[is_black] = (0, 0, 0)
-
-        for piece in self.whites + self.blacks:
-            draw_circle(arr, size*piece.y + size/2, size*piece.x + size/2, 12, white if piece.white else black)
-            if piece.king:
-                draw_circle(arr, size*piece.y + size/2, size*piece.x + size/2, 4, black if piece.white else white)
-
-        out = Image.fromarray(arr)
-        display(out)
-        print()
-        print()
-        print()
-        print()
-        print()
+        from Renderer import show
+        show(self, black_moves)
@@ -0,0 +1,199 @@
+import os
+import time
+import signal
+import random
+import multiprocessing
+
+from Board import Board
+from Position import Position
+
+
+# Running bots in their own processes, with real clocks.
+#
+# A BotProcess keeps a bot in a separate, persistent process (the bot keeps its state, e.g. its transposition table,
+# between moves). For every move the board is sent to the process in the form of serialize (50 bytes), and the move comes
+# back as a tuple of (y, x) pairs, so exchanging a move costs a fraction of a millisecond.
+# The process is given a deadline: if it doesn't answer in time, it's stopped (and started again from the bot as it was
+# created, if the game goes on), so a bot which thinks too long can never stall the game.
+#
+# TimeControl describes the clocks of a game: either a fixed time per move, or a base time per game plus an increment
+# added after every move. Game (see Game.py) uses them when it's given a time_control.
+# A bot which has a time_limit attribute (like SearchBot) gets it set to the time it should use for the move.
+# A bot which has a ponder method (like SearchBot) can think on the opponent's time: after its move, its process gets
+# the board and passes it to ponder, which starts thinking in the background and returns at once. The next make_move
+# ends the pondering.
+
+# Time (in seconds) kept aside for sending the board and the move between the processes
+SAFETY_MARGIN = 0.02
+# The share of the time kept aside, because bots check their clocks only every so often (SearchBot every 256 nodes)
+SAFETY_FRACTION = 0.1
+# How many more moves we assume a game will last, to divide the remaining time of a base + increment clock
+MOVES_TO_GO = 30
+# How long (in seconds) we wait for a new process to be ready, and for a killed one to finish
+START_TIMEOUT = 30
+KILL_TIMEOUT = 5
+
+
+# Raised when a bot doesn't answer before its deadline
+class BotTimeout(Exception):
+    pass
+
+
+class TimeControl:
+    # per_move - seconds for every move, or base - seconds for the whole game and increment - seconds added after every move
+    def __init__(self, per_move=None, base=None, increment=0):
+        if (per_move is None) == (base is None):
+            raise ValueError("Give either the time per move or the base time", per_move, base)
+        self.per_move = per_move
+        self.base = base
+        self.increment = increment
+
+
+    # The time on the clock of a player at the start of a game
+    def start(self):
+        return self.per_move if self.per_move is not None else self.base
+
+
+    # The time a player should use for a move, given the time left on its clock
+    def budget(self, remaining):
+        if self.per_move is not None:
+            return max(0, self.per_move * (1 - SAFETY_FRACTION) - SAFETY_MARGIN)
+        return max(0, min(remaining / MOVES_TO_GO + self.increment, remaining / 2) * (1 - SAFETY_FRACTION) - SAFETY_MARGIN)
+
+
+    # The time left on the clock after a move which took elapsed seconds (negative if the time ran out)
+    def after_move(self, remaining, elapsed):
+        if self.per_move is not None:
+            return self.per_move if elapsed <= self.per_move else self.per_move - elapsed
+        remaining -= elapsed
+        return remaining + self.increment if remaining >= 0 else remaining
+
+
+    # The time on the clock of a player whose time ran out and who goes on playing (see Game's on_timeout): with a base
+    # time, the share of one move of a full clock, so that the player isn't out of time again at every later move
+    def after_timeout(self):
+        if self.per_move is not None:
+            return self.per_move
+        return self.base / MOVES_TO_GO + self.increment
+
+
+# The loop of a bot's process: get a board, answer with a move
+def _serve(connection, bot, board_class):
+    # The process gets its own process group, so that killing it kills the processes started by the bot too
+    # (e.g. the workers of a ParallelSearchBot)
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # The process can only be killed with its group from now on, so it's not asked for moves before
+    connection.send(('ready',))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            message = ('close',)
+        if message[0] == 'close':
+            if hasattr(bot, 'close'):
+                bot.close()
+            return
+        if message[0] == 'ponder':
+            if hasattr(bot, 'ponder'):
+                bot.ponder(board_class.deserialize(message[1]))
+            continue
+        data, budget = message[1], message[2]
+        if budget is not None and hasattr(bot, 'time_limit'):
+            bot.time_limit = budget
+        start_cpu = time.process_time()
+        try:
+            move = bot.make_move(board_class.deserialize(data))
+            connection.send(('move', tuple((p.y, p.x) for p in move), dict(getattr(bot, 'last_search', {}) or {}),
+                             time.process_time() - start_cpu))
+        except Exception as e:
+            connection.send(('error', repr(e)))
+
+
+class BotProcess:
+    # bot - the bot to run (it's passed to the new process, so with the 'spawn' start method its class has to be importable)
+    # board_class - Board or BitBoard, the representation the bot gets
+    def __init__(self, bot, board_class=Board):
+        self.bot = bot
+        self.board_class = board_class
+        self.process = None
+        self.connection = None
+        # Statistics of the last move: the bot's last_search and the CPU time of its process
+        self.last_search = {}
+        self.cpu_time = 0
+
+
+    # Start the process and wait until it's ready (Game starts the processes before the clocks run; otherwise it happens
+    # at the first move)
+    def start(self):
+        if self.process is None:
+            self.connection, child = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(target=_serve, args=(child, self.bot, self.board_class))
+            self.process.start()
+            child.close()
+            try:
+                ready = self.connection.poll(START_TIMEOUT) and self.connection.recv() == ('ready',)
+            except EOFError:
+                ready = False
+            if not ready:
+                self.kill()
+                raise RuntimeError("The bot's process hasn't started")
+
+
+    # Stop the process
+    def close(self):
+        if self.process is not None:
+            try:
+                self.connection.send(('close',))
+            except (OSError, BrokenPipeError):
+                pass
+            self.process.join(1)
+            self.kill()
+
+
+    # Stop the process at once (e.g. when it's still thinking after its deadline). The next move starts it again
+    # If the process group can't be killed (e.g. it doesn't exist yet), the process itself is
+    def kill(self):
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                self.process.kill()
+            self.process.join(KILL_TIMEOUT)
+            self.connection.close()
+            self.process = None
+
+
+    # Let the bot think on the opponent's time, on the board after its move. Nothing is waited for
+    def ponder(self, board):
+        if self.process is not None:
+            self.connection.send(('ponder', board.serialize()))
+
+
+    # Ask the bot for a move, without any deadline
+    def make_move(self, board):
+        return self.timed_move(board, None, None)
+
+
+    # Ask the bot for a move, telling it to use budget seconds. If it doesn't answer within timeout seconds, its process
+    # is stopped and BotTimeout is raised. Errors of the bot are raised as RuntimeError
+    def timed_move(self, board, budget, timeout):
+        self.start()
+        self.connection.send(('move', board.serialize(), budget))
+        if not self.connection.poll(timeout):
+            self.kill()
+            raise BotTimeout()
+        try:
+            message = self.connection.recv()
+        except EOFError:
+            self.kill()
+            raise RuntimeError("The bot's process has died")
+        if message[0] == 'error':
+            raise RuntimeError(message[1])
+        self.last_search, self.cpu_time = message[2], message[3]
+        return [Position(y, x) for (y, x) in message[1]]
+
+
+# What a bot whose time ran out plays when the game is set to go on: a random legal move
+def fallback_move(board):
+    return random.choice(board.legal_moves())
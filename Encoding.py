@@ -0,0 +1,146 @@
+import numpy as np
+
+from Board import RAYS, SQUARES, DIRECTIONS, EMPTY, WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING, PIECE_SQUARE
+
+
+# Encoding boards as NumPy arrays, and evaluating many boards at once.
+# Boards are encoded from the bytes of serialize (so it works with both Board and BitBoard). The only Python loop is the one
+# inside serialize (Board.serialize goes over the pieces of a board); joining and decoding the bytes is done at once for
+# the whole list. A list of N boards becomes either
+# - an (N, 50) int8 array of square codes (EMPTY, WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING), one per dark square,
+#   in the order of Board.SQUARES, or
+# - an (N, 4, 10, 10) int8 array of planes: white men, white kings, black men, black kings (1 where the piece stands).
+# Like everything else, the boards are seen by the player who moves next (white).
+#
+# BatchEvaluator scores a whole batch of boards with a few NumPy operations, so a bot can score all the children of a node
+# in one call (for move ordering, or for evaluating the leaves of its search) instead of calling an evaluation function
+# thousands of times.
+
+# Row and column of every dark square
+SQUARE_Y = np.array([y for (y, x) in SQUARES])
+SQUARE_X = np.array([x for (y, x) in SQUARES])
+
+# NEIGHBOURS[i, d, k] is the number of the dark square we reach after k + 1 steps from square i in the direction
+# DIRECTIONS[d], or 50 (an extra square which is never empty) if we leave the board
+NEIGHBOURS = np.full((50, 4, 9), 50, dtype=np.intp)
+for _i, (_y, _x) in enumerate(SQUARES):
+    for _d in range(4):
+        for _k, (_ny, _nx) in enumerate(RAYS[_y][_x][_d]):
+            NEIGHBOURS[_i, _d, _k] = 5 * _ny + _nx // 2
+
+# White moves forward (the first two directions), black backward (the last two)
+WHITE_FORWARD = [d for d, (dy, dx) in enumerate(DIRECTIONS) if dy > 0]
+BLACK_FORWARD = [d for d, (dy, dx) in enumerate(DIRECTIONS) if dy < 0]
+
+# Default piece-square tables (for white; black uses them turned around): Board.PIECE_SQUARE, one number per dark square
+MAN_TABLE = np.array([PIECE_SQUARE[0][y][x] for (y, x) in SQUARES])
+KING_TABLE = np.array([PIECE_SQUARE[1][y][x] for (y, x) in SQUARES])
+
+
+# Encode boards as an (N, 50) array of square codes
+def encode(boards):
+    data = b''.join(board.serialize() for board in boards)
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, 50)
+
+
+# Encode boards as an (N, 4, 10, 10) array of planes: white men, white kings, black men, black kings
+def encode_planes(boards):
+    return codes_to_planes(encode(boards))
+
+
+# Turn an (N, 50) array of square codes into planes
+def codes_to_planes(codes):
+    planes = np.zeros((len(codes), 4, 10, 10), dtype=np.int8)
+    kinds = np.array([WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING], dtype=np.int8)
+    planes[:, :, SQUARE_Y, SQUARE_X] = codes[:, None, :] == kinds[None, :, None]
+    return planes
+
+
+# Turn the boards encoded as square codes around (the other player moves next)
+def revert_codes(codes):
+    turned = codes[:, ::-1].copy()
+    pieces = turned != EMPTY
+    turned[pieces] = np.where(turned[pieces] <= WHITE_KING, turned[pieces] + 2, turned[pieces] - 2)
+    return turned
+
+
+class BatchEvaluator:
+    # The weights are in hundredths of a man, like the scores of Search.py:
+    # man, king - the value of a piece, advancement - a bonus for every row a man has advanced,
+    # man_table, king_table - piece-square tables (50 numbers, one per dark square, for white), mobility - a bonus for every
+    # move (without captures) of the player, minus the same for every move of the opponent
+    def __init__(self, man=100, king=300, advancement=2, man_table=MAN_TABLE, king_table=KING_TABLE, mobility=1):
+        self.man = man
+        self.king = king
+        self.advancement = advancement
+        self.man_table = np.asarray(man_table)
+        self.king_table = np.asarray(king_table)
+        self.mobility = mobility
+        # The type of the scores: integers, unless some of the weights (e.g. learned ones) are floats
+        self.dtype = np.result_type(man, king, advancement, mobility, self.man_table, self.king_table, np.int64)
+
+
+    # Score one board (for white). This makes the evaluator usable as an evaluation function of SearchBot
+    def __call__(self, board):
+        return int(round(self.evaluate_codes(encode([board]))[0]))
+
+
+    # Score a list of boards (for white). Returns an array of scores
+    def evaluate(self, boards):
+        return self.evaluate_codes(encode(boards))
+
+
+    # Score boards encoded with encode
+    def evaluate_codes(self, codes):
+        white_men = codes == WHITE_MAN
+        white_kings = codes == WHITE_KING
+        black_men = codes == BLACK_MAN
+        black_kings = codes == BLACK_KING
+
+        scores = np.zeros(len(codes), dtype=self.dtype)
+        scores += self.man * (white_men.sum(axis=1) - black_men.sum(axis=1))
+        scores += self.king * (white_kings.sum(axis=1) - black_kings.sum(axis=1))
+        # A white man has advanced y rows, a black one 9 - y
+        scores += self.advancement * (white_men @ SQUARE_Y - black_men @ (9 - SQUARE_Y))
+        # Black's tables are white's turned around: square i for black is square 49 - i for white
+        scores += white_men @ self.man_table - black_men @ self.man_table[::-1]
+        scores += white_kings @ self.king_table - black_kings @ self.king_table[::-1]
+        if self.mobility:
+            scores += self.mobility * (self.moves(codes, white_men, white_kings, WHITE_FORWARD) -
+                                       self.moves(codes, black_men, black_kings, BLACK_FORWARD))
+        return scores
+
+
+    # Count the moves without captures of the men and kings (boolean (N, 50) arrays), where men go in the given directions
+    @staticmethod
+    def moves(codes, men, kings, forward):
+        # An extra square, which is never empty, stands for everything outside the board
+        empty = np.zeros((len(codes), 51), dtype=bool)
+        empty[:, :50] = codes == EMPTY
+        # A man can step to an empty neighbouring square forward
+        counts = (men * empty[:, NEIGHBOURS[:, forward, 0]].sum(axis=2)).sum(axis=1)
+        # A king can slide over every empty square until the first occupied one, in every direction
+        # Kings are rare, so only the rays of the squares where they stand are looked at
+        board, square = np.nonzero(kings)
+        if len(board):
+            slides = np.logical_and.accumulate(empty[board[:, None, None], NEIGHBOURS[square]], axis=2).sum(axis=(1, 2))
+            counts += np.bincount(board, slides, minlength=len(codes)).astype(counts.dtype)
+        return counts
+
+
+    # Score the boards after every one of the moves, for the player making them (so the best move has the highest score).
+    # The moves are made with push and taken back with pop, so the board is unchanged afterwards
+    def evaluate_children(self, board, moves):
+        data = []
+        for move in moves:
+            board.push(move)
+            data.append(board.serialize())
+            board.pop()
+        codes = np.frombuffer(b''.join(data), dtype=np.int8).reshape(-1, 50)
+        return -self.evaluate_codes(codes)
+
+
+    # Sort the moves from the best one, according to the scores of the boards after them
+    def order_moves(self, board, moves):
+        scores = self.evaluate_children(board, moves)
+        return [moves[i] for i in np.argsort(-scores, kind='stable')]
@@ -4,14 +4,30 @@ from Board import Board
 # This class holds a full state of the game: a board (as a Board class), an information wether it's the white player's move, and an information wether the game has already finished because one of the players lost
 
 # If a player attempts to make a move which isn't allowed (e. g. move a piece outside of a board, capture more than two enemy's pieces at the same time, move not diagonally, etc., they loose
+# board_class selects the representation of the board (Board or BitBoard); bots use both of them in the same way
+# If verbose is false, the engine doesn't print anything (useful when many games are played without watching them)
+# A position which occurs for the third time (with the same player to move) is a draw
+# If a tablebase (see Tablebase.py) is given, the game finishes as soon as the board is in it and its result is certain:
+# a draw, or a win which comes before the limit of boring moves can end the game
 class Engine:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, board_class=Board, verbose=True, tablebase=None):
+        self.board = board_class()
+        self.verbose = verbose
+        self.tablebase = tablebase
         self.white_moves = True
         self.game_finished = False
         self.boring_moves = 0
         self.limit_boring_moves = 25
+        # The number of boring moves in a row after every move of the game
+        self.boring_history = []
+        # The number of times a position has to occur for a draw
+        self.limit_repetitions = 3
         self.draw = False
+        # 'white' or 'black' when the game is won
+        self.winner = None
+        # Why the game finished: 'no moves' (the loser can't move), 'boring moves' (a draw after too many boring moves),
+        # 'repetition' (a draw when a position occurs for the third time) or 'tablebase'
+        self.reason = None
     
     # Returns a safe copy of a board
     def get_board(self):
@@ -19,23 +35,23 @@ class Engine:
     
     # A player makes a move, update the game's state
     def make_move(self, moves):
-        boring_move = False
-        if len(moves) == 2:
-            if self.board.world[moves[0].y][moves[0].x] != None:
-                if self.board.world[moves[0].y][moves[0].x].king:
-                    boring_move = True
+        # A king's move from one square to another is boring (the board is asked directly, so a turned around Board doesn't
+        # have to build its world)
+        boring_move = len(moves) == 2 and self.board.isKing(moves[0])
           
         if boring_move:
             self.boring_moves += 1
-            print(self.boring_moves)
         else:
             self.boring_moves = 0
+        self.boring_history += [self.boring_moves]
             
         if self.boring_moves >= self.limit_boring_moves:
             winner = "draw"
-            print("draw")
+            if self.verbose:
+                print("draw")
             self.game_finished = True
             self.draw = True
+            self.reason = "boring moves"
         
         
         new_board = self.board
@@ -48,8 +64,41 @@ class Engine:
         self.white_moves = not self.white_moves
 
         if self.board.white_lost():
-            winner = "black" if self.white_moves else "white"
+            self.winner = "black" if self.white_moves else "white"
+            if not self.draw:
+                self.reason = "no moves"
             self.game_finished = True
-            print(winner + " won!")
+            if self.verbose:
+                print(self.winner + " won!")
+        elif not self.game_finished and self.board.repetitions() + 1 >= self.limit_repetitions:
+            self.game_finished = True
+            self.draw = True
+            self.reason = "repetition"
+            if self.verbose:
+                print("draw (repetition)")
+        elif not self.game_finished and self.tablebase is not None:
+            self.adjudicate()
+
+        return self.board
 
-        return self.board
\ No newline at end of file
+
+    # Finish the game if the tablebase knows its result
+    # Tablebase.py (with its tools) is imported only here, so that the engine stays light when no tablebase is used
+    def adjudicate(self):
+        from Tablebase import WON, DRAWN
+        found = self.tablebase.probe(self.board)
+        if found is None:
+            return
+        result, distance = found
+        if result == DRAWN:
+            self.draw = True
+        elif distance < self.limit_boring_moves - self.boring_moves:
+            # Every move increases the counter of boring moves by at most one, so the game ends before it reaches the limit
+            mover, other = ("white", "black") if self.white_moves else ("black", "white")
+            self.winner = mover if result == WON else other
+        else:
+            return
+        self.game_finished = True
+        self.reason = "tablebase"
+        if self.verbose:
+            print("draw (tablebase)" if self.draw else self.winner + " won (tablebase)")
\ No newline at end of file
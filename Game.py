@@ -1,6 +1,4 @@
 import time
-from PIL import Image, ImageColor
-import IPython.display
 
 from Position import Position
 from Board import Board
@@ -24,14 +22,32 @@ from Engine import Engine
 
 class Game:
     # Initialise a new game with a starting board position and with the white player moving first
-    # We store the history of the whole game (and the winner) in result
+    # We store the history of the whole game, the winner and the reason why the game finished in result
     # white, black are bots which we want to play either white or black
-    def __init__(self, white, black):
-        self.engine = Engine()
+    # board_class selects the representation of the board which bots get (Board or BitBoard from BitBoard.py)
+    # If verbose is false, nothing is printed. Set move_length to 0 to play bots' games as fast as possible
+    # With a tablebase (see Tablebase.py), games end as soon as their result is known from it
+    # For every ply, result['stats'] keeps how long the player thought (wall-clock and CPU time of this process),
+    # how long the engine took to check and make the move, the number of boring moves in a row and the statistics
+    # of the search, if the bot reports them in last_search (like SearchBot). on_ply, if given, is called with the
+    # statistics of every ply as soon as it's played
+    # With a time_control (see BotProcess.py), every bot plays in its own process and has a clock. A bot whose time runs out
+    # loses the game (reason 'time'), or, if on_timeout is 'fallback', a random legal move is played for it
+    # With ponder, bots which can (like SearchBot) think on the opponent's time; every bot then plays in its own process
+    def __init__(self, white, black, board_class=Board, verbose=True, tablebase=None, on_ply=None, time_control=None,
+                 on_timeout='lose', ponder=False):
+        self.engine = Engine(board_class, verbose, tablebase)
         self.white = white
         self.black = black
+        self.verbose = verbose
+        self.on_ply = on_ply
+        self.time_control = time_control
+        self.on_timeout = on_timeout
+        self.ponder = ponder
+        # The time left on the clocks of the players (white: True, black: False)
+        self.clocks = {}
         self.continue_game = True
-        self.result = {'moves': [], 'winner': ''}
+        self.result = {'moves': [], 'winner': '', 'reason': '', 'stats': []}
         self.move_length = 1
     
     
@@ -44,36 +60,109 @@ class Game:
         return to_return
     
     
+    # Clear the output of a notebook cell before drawing the next board
+    # IPython is imported only when a board is drawn, so that games played without drawing don't need it
+    @staticmethod
+    def clear_output():
+        import IPython.display
+        IPython.display.clear_output()
+    
+    
+    # Remember the statistics of a ply and pass them to on_ply
+    def record_ply(self, is_white, think_time, cpu_time, engine_time, player):
+        stats = {
+            'player': 'white' if is_white else 'black', 'think_time': think_time, 'cpu_time': cpu_time,
+            'engine_time': engine_time, 'boring_moves': self.engine.boring_moves}
+        search = getattr(player, 'last_search', None)
+        if search:
+            stats['search'] = dict(search)
+        if is_white in self.clocks:
+            stats['clock'] = self.clocks[is_white]
+        self.result['stats'] += [stats]
+        if self.on_ply is not None:
+            self.on_ply(stats)
+    
+    
+    # Ask a bot for a move. Returns the move (or None if the bot's time ran out), the time it took and its CPU time
+    # With clocks, the bot gets its share of the time left on its clock and loses if it thinks longer than all of it
+    def ask_bot(self, bot, is_white):
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        if not self.clocks:
+            move = bot.make_move(self.engine.board)
+            # A bot in its own process (a BotProcess) reports the CPU time of that process
+            cpu_time = bot.cpu_time if hasattr(bot, 'timed_move') else time.process_time() - start_cpu
+            return move, time.perf_counter() - start_time, cpu_time
+
+        from BotProcess import BotTimeout
+        remaining = self.clocks[is_white]
+        try:
+            move = bot.timed_move(self.engine.board, self.time_control.budget(remaining), remaining)
+        except BotTimeout:
+            move = None
+        think_time = time.perf_counter() - start_time
+        self.clocks[is_white] = self.time_control.after_move(remaining, think_time)
+        if self.clocks[is_white] < 0:
+            move = None
+        # A process stopped after its deadline is started again now, so that starting it doesn't count in the next move
+        if move is None and self.on_timeout == 'fallback':
+            bot.start()
+        return move, think_time, bot.cpu_time if move is not None else 0
+    
+    
     # Ask a playing bot what move to make and make it
     def bot_move(self, bot, is_white, draw_board=True):
-        move = bot.make_move(self.engine.board)
+        start_time = time.perf_counter()
+        move, think_time, cpu_time = self.ask_bot(bot, is_white)
+        if move is None:
+            if self.on_timeout != 'fallback':
+                self.record_ply(is_white, think_time, cpu_time, 0, bot)
+                self.result['winner'] = 'black' if is_white else 'white'
+                self.result['reason'] = 'time'
+                if self.verbose:
+                    print("Time is up - BLACK WINS" if is_white else "Time is up - WHITE WINS")
+                self.continue_game = False
+                return
+            from BotProcess import fallback_move
+            move = fallback_move(self.engine.board)
+            self.clocks[is_white] = self.time_control.after_timeout()
         self.result['moves'] += [Game.move_to_dictionary(move)]
         
-        start_time = time.time()
+        engine_start = time.perf_counter()
         try:
             self.engine.make_move(move)
         except ValueError as ve:
-            print("Move not allowed - BLACK WINS" if is_white else "Move not allowed - WHITE WINS")
+            self.record_ply(is_white, think_time, cpu_time, time.perf_counter() - engine_start, bot)
             self.result['winner'] = 'black' if is_white else 'white'
-            print(ve.args[0])
-            print(ve.args[2])
-            ve.args[1].show()
+            self.result['reason'] = 'illegal move'
+            if self.verbose:
+                print("Move not allowed - BLACK WINS" if is_white else "Move not allowed - WHITE WINS")
+                print(ve.args[0])
+                print(ve.args[2])
+            if draw_board:
+                ve.args[1].show()
             self.continue_game = False
             return
-        end_time = time.time()
-        time_elapsed = end_time - start_time
+        self.record_ply(is_white, think_time, cpu_time, time.perf_counter() - engine_start, bot)
+        # The bot thinks on the opponent's time, starting from the board the opponent gets
+        if self.ponder and not self.engine.game_finished and hasattr(bot, 'ponder'):
+            bot.ponder(self.engine.board)
+        # A move takes at least move_length seconds, together with the bot's thinking
+        time_elapsed = time.perf_counter() - start_time
         if time_elapsed < self.move_length:
             time.sleep(self.move_length - time_elapsed)
             
         if draw_board:
-            IPython.display.clear_output()
+            Game.clear_output()
             self.engine.board.show(is_white)
 
         if (self.engine.game_finished):
+            self.result['reason'] = self.engine.reason
             if not self.engine.draw:
-                print("WHITE WINS" if is_white else "BLACK WINS")
-                self.result['winner'] = 'white' if is_white else 'black'
-            else:
+                if self.verbose:
+                    print(self.engine.winner.upper() + " WINS")
+                self.result['winner'] = self.engine.winner
+            elif self.verbose:
                 print("DRAW")
             self.continue_game = False
     
@@ -81,6 +170,7 @@ class Game:
     # Ask a human player what move to make and make it
     def human_move(self, is_white, draw_board):
         correct_move_entered = False
+        start_time = time.perf_counter()
         while not correct_move_entered:
             pre_move = input("Your move").split()
             move = []
@@ -92,8 +182,11 @@ class Game:
                     move[i] = Position(9 - move[i].y, 9 - move[i].x)
 
             try:
+                engine_start = time.perf_counter()
                 self.engine.make_move(move)
+                engine_time = time.perf_counter() - engine_start
                 self.result['moves'] += [Game.move_to_dictionary(move)]
+                self.record_ply(is_white, engine_start - start_time, 0, engine_time, None)
                 correct_move_entered = True
             except ValueError as ve:
                 print("Move not allowed: " + ve.args[0])
@@ -101,14 +194,16 @@ class Game:
                 return
             
         if draw_board:
-            IPython.display.clear_output()
+            Game.clear_output()
             self.engine.board.show(is_white)
 
         if (self.engine.game_finished):
+            self.result['reason'] = self.engine.reason
             if not self.engine.draw:
-                print("WHITE WINS" if is_white else "BLACK WINS")
-                self.result['winner'] = 'white' if is_white else 'black'
-            else:
+                if self.verbose:
+                    print(self.engine.winner.upper() + " WINS")
+                self.result['winner'] = self.engine.winner
+            elif self.verbose:
                 print("DRAW")
             self.continue_game = False
     
@@ -116,20 +211,40 @@ class Game:
     # Run a game of two bots against each other
     def play_bots(self, draw_board=True):
         self.continue_game = True
-        self.result = {'moves': [], 'winner': ''}
+        self.result = {'moves': [], 'winner': '', 'reason': '', 'stats': []}
+        white, black = self.white, self.black
+        processes = started = []
+        self.clocks = {}
+        if self.time_control is not None or self.ponder:
+            # Every bot plays in its own process; the processes started here are stopped at the end of the game
+            # BotProcess.py (and multiprocessing) is imported only here, so that games without processes don't need it
+            from BotProcess import BotProcess
+            board_class = type(self.engine.board)
+            white, black = [bot if isinstance(bot, BotProcess) else BotProcess(bot, board_class) for bot in (white, black)]
+            processes = [white, black]
+            started = [bot for bot in processes if bot not in (self.white, self.black)]
+        if self.time_control is not None:
+            self.clocks = {True: self.time_control.start(), False: self.time_control.start()}
         
-        while self.continue_game:
-            self.bot_move(self.white, True, draw_board)
-            if not self.continue_game:
-                break
-            self.bot_move(self.black, False, draw_board)
+        try:
+            # The processes start before the clocks run, so starting them doesn't count in the first moves
+            for bot in processes:
+                bot.start()
+            while self.continue_game:
+                self.bot_move(white, True, draw_board)
+                if not self.continue_game:
+                    break
+                self.bot_move(black, False, draw_board)
+        finally:
+            for bot in started:
+                bot.close()
         return self.result
 
     
     # Run a game of a bot against a human. Variable bot_white should be true if we want the bot to play whites. If you want to draw a board after each move, variable draw_board should be true
     def play_human(self, bot_white, draw_board=True):
         self.continue_game = True
-        self.result = {'moves': [], 'winner': ''}
+        self.result = {'moves': [], 'winner': '', 'reason': '', 'stats': []}
         if bot_white:
             self.bot_move(self.white, bot_white, draw_board)
             
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+
+from Board import Board
+from BitBoard import BitBoard
+from Engine import Engine
+from Position import Position
+
+
+# A compact file format for recorded games, a streaming writer and reader, and a tool which replays recorded games
+# to check them.
+#
+# A file starts with a header (magic and version) followed by games, one after another. Every game is:
+#   - its length in bytes (4 bytes), so that a reader can skip it without decoding it,
+#   - its header: the winner (1 byte: 0 - a draw or no result, 1 - white, 2 - black), the reason why it finished
+#     (1 byte, an index in REASONS), the names of the players (each as its length in 2 bytes and its UTF-8 bytes)
+#     and the number of moves (2 bytes),
+#   - its moves: every move as the number of its points (1 byte) and the points, one byte each (10 * y + x, in the
+#     coordinates of the player who made the move, exactly as in Game.result).
+# Games are only ever appended, so a file can be written while a tournament runs and read while it's being written.
+#
+#   python GameRecord.py convert tournament.jsonl --output games.bin   - convert results written by TournamentRunner.py
+#   python GameRecord.py validate games.bin                            - replay all the games and check them
+#   python GameRecord.py show games.bin                                - print the headers of the games
+
+MAGIC = b'DRGR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sI')
+GAME_LENGTH = struct.Struct('<I')
+NAME_LENGTH = struct.Struct('<H')
+MOVE_COUNT = struct.Struct('<H')
+
+WINNERS = ['', 'white', 'black']
+# Reasons why games finish (see Engine.reason, Game.result and Server.py)
+REASONS = ['', 'no moves', 'illegal move', 'boring moves', 'tablebase', 'crash', 'time', 'resigned', 'repetition']
+
+
+# Encode the header and the moves of a game. result is a Game.result (moves as lists of {'y': .., 'x': ..} dictionaries)
+def encode_game(result, white='', black=''):
+    winner = result.get('winner') or ''
+    reason = result.get('reason') or ''
+    data = bytearray([WINNERS.index(winner if winner in WINNERS else ''), REASONS.index(reason)])
+    for name in (white, black):
+        name = name.encode()
+        data += NAME_LENGTH.pack(len(name)) + name
+    data += MOVE_COUNT.pack(len(result['moves']))
+    for move in result['moves']:
+        points = [10 * point['y'] + point['x'] for point in move]
+        if any(not (0 <= point['y'] < 10 and 0 <= point['x'] < 10) for point in move):
+            raise ValueError("A move outside the board can't be recorded", move)
+        data += bytes([len(points)]) + bytes(points)
+    return GAME_LENGTH.pack(len(data)) + data
+
+
+# Decode a game encoded by encode_game (without its length). Moves are returned as tuples of points (10 * y + x),
+# like TranspositionTable.encode_move
+def decode_game(data):
+    winner, reason = WINNERS[data[0]], REASONS[data[1]]
+    offset = 2
+    names = []
+    for i in range(2):
+        length = NAME_LENGTH.unpack_from(data, offset)[0]
+        names.append(bytes(data[offset + NAME_LENGTH.size:offset + NAME_LENGTH.size + length]).decode())
+        offset += NAME_LENGTH.size + length
+    count = MOVE_COUNT.unpack_from(data, offset)[0]
+    offset += MOVE_COUNT.size
+    moves = []
+    for i in range(count):
+        length = data[offset]
+        moves.append(tuple(data[offset + 1:offset + 1 + length]))
+        offset += 1 + length
+    return {'white': names[0], 'black': names[1], 'winner': winner, 'reason': reason, 'moves': moves}
+
+
+# Turn a decoded game into the form of Game.result (moves as lists of {'y': .., 'x': ..} dictionaries)
+def to_result(game):
+    result = dict(game)
+    result['moves'] = [[{'y': point // 10, 'x': point % 10} for point in move] for move in game['moves']]
+    return result
+
+
+# Appends games to a file. Usable with with:
+#   with GameWriter('games.bin') as writer:
+#       writer.write(game.result, 'bot A', 'bot B')
+class GameWriter:
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.games = 0
+
+
+    # Append a game. result is a Game.result, white and black are the names of the players
+    def write(self, result, white='', black=''):
+        self.file.write(encode_game(result, white, black))
+        self.games += 1
+
+
+    def flush(self):
+        self.file.flush()
+
+
+    def close(self):
+        self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+# Iterate over the games of a file, reading them one by one. A game which is still being written is not returned
+def read_games(path):
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header) != (MAGIC, VERSION):
+            raise ValueError("Not a file of game records", path)
+        while True:
+            length = f.read(GAME_LENGTH.size)
+            if len(length) < GAME_LENGTH.size:
+                return
+            data = f.read(GAME_LENGTH.unpack(length)[0])
+            if len(data) < GAME_LENGTH.unpack(length)[0]:
+                return
+            yield decode_game(data)
+
+
+# Check whether a file is a file of game records
+def is_record_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# Replay a decoded game through an Engine (so with Board.make_move and the rules of finishing games) and check that
+# every move is allowed and that the game finished as recorded. Returns None if the game is correct, otherwise a message
+def replay(game, board_class=Board):
+    engine = Engine(board_class, verbose=False)
+    moves = game['moves']
+    for ply, code in enumerate(moves):
+        move = [Position(point // 10, point % 10) for point in code]
+        if engine.game_finished:
+            return "move %d played after the end of the game" % ply
+        try:
+            engine.make_move(move)
+        except ValueError as ve:
+            if ply == len(moves) - 1 and game['reason'] == 'illegal move':
+                return None
+            return "move %d not allowed: %s" % (ply, ve.args[0])
+
+    # Games recorded without a reason are checked against the reason given by the engine
+    reason = game['reason'] or (engine.reason if engine.game_finished else '')
+    if reason in ('no moves', 'boring moves', 'repetition'):
+        if not engine.game_finished or engine.reason != reason:
+            return "the game should have finished by '%s'" % reason
+        if (engine.winner or '') != game['winner'] and not engine.draw:
+            return "the winner should be '%s'" % (engine.winner or '')
+    elif reason == 'illegal move':
+        return "the last move should have been illegal"
+    elif engine.game_finished and reason not in ('tablebase', 'crash', 'time', 'resigned'):
+        return "the game finished by '%s', but was recorded as '%s'" % (engine.reason, reason)
+    return None
+
+
+# Replay all the games of the files and report the errors and the throughput
+def validate(paths, board_class=Board, verbose=True):
+    games = plies = errors = 0
+    start_time = time.time()
+    for path in paths:
+        for number, game in enumerate(read_games(path)):
+            error = replay(game, board_class)
+            games += 1
+            plies += len(game['moves'])
+            if error is not None:
+                errors += 1
+                if verbose:
+                    print("%s, game %d (%s vs %s): %s" % (path, number, game['white'], game['black'], error))
+    elapsed = time.time() - start_time
+    print("%d games, %d plies, %d errors in %.1f s: %.1f games/s, %.0f plies/s" % (
+        games, plies, errors, elapsed, games / elapsed if elapsed > 0 else 0, plies / elapsed if elapsed > 0 else 0))
+    return errors
+
+
+# Convert results of games (JSON lines written by TournamentRunner.py, or JSON files with lists of Game.result) to records
+def convert(paths, output):
+    with GameWriter(output) as writer:
+        for path in paths:
+            with open(path) as f:
+                text = f.read()
+            results = json.loads(text) if text.lstrip().startswith('[') else \
+                [json.loads(line) for line in text.splitlines() if line.strip()]
+            for result in results:
+                if result.get('error') and not result.get('reason'):
+                    result = dict(result, reason='crash')
+                if result.get('winner') == 'draw':
+                    result = dict(result, winner='')
+                writer.write(result, result.get('white', ''), result.get('black', ''))
+        games = writer.games
+    print("%d games written to %s (%d bytes)" % (games, output, os.path.getsize(output)), file=sys.stderr)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Convert, check and show files of recorded games")
+    parser.add_argument('command', choices=['convert', 'validate', 'show'])
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--output', default='games.bin', help="the file written by convert")
+    parser.add_argument('--bitboard', action='store_true', help="replay the games on BitBoards")
+    parser.add_argument('--quiet', action='store_true', help="don't print every error")
+    args = parser.parse_args(arguments)
+
+    if args.command == 'convert':
+        convert(args.files, args.output)
+    elif args.command == 'validate':
+        return 1 if validate(args.files, BitBoard if args.bitboard else Board, not args.quiet) else 0
+    else:
+        for path in args.files:
+            for game in read_games(path):
+                print("%-20s %-20s %-6s %-13s %4d plies" % (
+                    game['white'], game['black'], game['winner'] or 'draw', game['reason'], len(game['moves'])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from PIL import Image, ImageColor
 
 # Helper function to draw a circle on image arr, at position (y, x), of radius r and in colour colour
 def draw_circle(arr, y, x, r, colour):
@@ -0,0 +1,235 @@
+import sys
+import json
+import mmap
+import random
+import struct
+import argparse
+
+from Board import Board
+from Position import Position
+from TranspositionTable import encode_move, decode_move
+from GameRecord import read_games, is_record_file, to_result
+
+
+# An opening book: for positions from the first moves of recorded games, the moves which were played there and how the
+# games went on after them (wins, draws and losses of the player who made the move).
+#
+# The book is built from the results of games (Game.result, or the records written by TournamentRunner.py), replayed
+# from Board(). Positions are identified by their Zobrist keys (see Zobrist.py), so the book works with Board and BitBoard.
+# It is kept in a binary file:
+#   - a header: magic, version, number of positions,
+#   - an index, sorted by key: for every position its key, the offset of its moves and the number of its moves,
+#   - the moves: for every move its number of squares, its squares (10 * y + x, as in TranspositionTable.encode_move),
+#     and the numbers of wins, draws and losses.
+# The file is opened with mmap and positions are found with binary search over the index, so the book is never loaded
+# into memory.
+#
+#   python OpeningBook.py tournament.jsonl --output book.bin --plies 16
+#   python OpeningBook.py --show book.bin
+
+MAGIC = b'DRBK'
+VERSION = 1
+# Header: magic, version, number of positions
+HEADER = struct.Struct('<4sII')
+# Index entry: key, offset of the moves (from the start of the file), number of moves
+INDEX_ENTRY = struct.Struct('<QII')
+# Statistics of a move: wins, draws, losses
+STATISTICS = struct.Struct('<III')
+
+
+# Read the results of games from files: JSON lines (one result per line, as written by TournamentRunner.py),
+# JSON files with a list of results or files of game records (see GameRecord.py)
+def read_results(paths):
+    for path in paths:
+        if is_record_file(path):
+            yield from (to_result(game) for game in read_games(path))
+            continue
+        with open(path) as f:
+            text = f.read()
+        if text.lstrip().startswith('['):
+            yield from json.loads(text)
+        else:
+            for line in text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Count, for every position of the first plies of every game, the moves played there and their results
+# Returns a dictionary: key -> {encoded move -> [wins, draws, losses]}. Games which ended by a crash are skipped
+def collect(results, plies=16):
+    positions = {}
+    games = 0
+    for result in results:
+        if result.get('error'):
+            continue
+        games += 1
+        board = Board()
+        for ply, move in enumerate(result['moves'][:plies]):
+            move = [Position(m['y'], m['x']) for m in move]
+            player = 'white' if ply % 2 == 0 else 'black'
+            statistics = positions.setdefault(board.key, {}).setdefault(encode_move(move), [0, 0, 0])
+            if result['winner'] == player:
+                statistics[0] += 1
+            elif result['winner'] in ('white', 'black'):
+                statistics[2] += 1
+            else:
+                statistics[1] += 1
+            try:
+                board = board.make_move(move)
+            except ValueError:
+                break
+    return positions, games
+
+
+# Write the positions collected by collect to a book file. Moves played in fewer than min_games games are left out
+def write_book(path, positions, min_games=1):
+    entries = []
+    for key in sorted(positions):
+        moves = [(code, statistics) for code, statistics in positions[key].items() if sum(statistics) >= min_games]
+        if moves:
+            entries.append((key, moves))
+
+    offset = HEADER.size + len(entries) * INDEX_ENTRY.size
+    index = bytearray()
+    blob = bytearray()
+    for key, moves in entries:
+        index += INDEX_ENTRY.pack(key, offset + len(blob), len(moves))
+        for code, statistics in sorted(moves, key=lambda move: -sum(move[1])):
+            blob += bytes([len(code)]) + bytes(code) + STATISTICS.pack(*statistics)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        f.write(index)
+        f.write(blob)
+    return len(entries)
+
+
+class OpeningBook:
+    # Open a book file
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not an opening book file", path)
+
+
+    # A book sent to another process opens the file again there
+    def __reduce__(self):
+        return OpeningBook, (self.path,)
+
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+    # Find the moves of the position with the given key. Returns a list of (encoded move, wins, draws, losses),
+    # the most played moves first (empty if the position isn't in the book)
+    def lookup_key(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = struct.unpack_from('<Q', self.data, HEADER.size + middle * INDEX_ENTRY.size)[0]
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.size:
+            return []
+        found_key, offset, count = INDEX_ENTRY.unpack_from(self.data, HEADER.size + low * INDEX_ENTRY.size)
+        if found_key != key:
+            return []
+
+        moves = []
+        for i in range(count):
+            length = self.data[offset]
+            code = tuple(self.data[offset + 1:offset + 1 + length])
+            offset += 1 + length
+            moves.append((code,) + STATISTICS.unpack_from(self.data, offset))
+            offset += STATISTICS.size
+        return moves
+
+
+    # Find the moves of a board, as lists of Positions: a list of (move, wins, draws, losses)
+    def lookup(self, board):
+        return [(decode_move(code), wins, draws, losses) for (code, wins, draws, losses) in self.lookup_key(board.key)]
+
+
+# A bot which plays moves from an opening book while it can, and asks another bot (e.g. a SearchBot) when the game
+# leaves the book.
+# choice - 'best' plays the move with the best score (wins plus half of the draws, per game), 'weighted' chooses a move
+# at random, with probabilities proportional to the number of games where it was played
+# min_games - moves played in fewer games are ignored
+class BookBot:
+    def __init__(self, bot, book, choice='best', min_games=1, seed=None):
+        self.bot = bot
+        self.book = OpeningBook(book) if isinstance(book, str) else book
+        # A book opened from its path belongs to the bot, which closes it in close
+        self.own_book = isinstance(book, str)
+        self.choice = choice
+        self.min_games = min_games
+        self.random = random.Random(seed)
+        self.last_search = {}
+
+
+    def make_move(self, board):
+        moves = [entry for entry in self.book.lookup_key(board.key) if sum(entry[1:]) >= self.min_games]
+        # Keys can collide, so the move is played only if it's legal
+        legal = {encode_move(move) for move in board.legal_moves()} if moves else set()
+        moves = [entry for entry in moves if entry[0] in legal]
+        if not moves:
+            move = self.bot.make_move(board)
+            self.last_search = dict(getattr(self.bot, 'last_search', {}), book=False)
+            return move
+
+        if self.choice == 'weighted':
+            code = self.random.choices(moves, weights=[sum(entry[1:]) for entry in moves])[0][0]
+        else:
+            code = max(moves, key=lambda entry: (entry[1] + entry[2] / 2) / sum(entry[1:]))[0]
+        self.last_search = {'book': True, 'games': sum(sum(entry[1:]) for entry in moves)}
+        return decode_move(code)
+
+
+    # Pondering is left to the other bot (it ponders only once it has searched, i.e. out of the book)
+    def ponder(self, board):
+        if hasattr(self.bot, 'ponder'):
+            self.bot.ponder(board)
+
+
+    # Close the other bot, and the book if the bot opened it itself
+    def close(self):
+        if hasattr(self.bot, 'close'):
+            self.bot.close()
+        if self.own_book:
+            self.book.close()
+            self.book = None
+            self.own_book = False
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Build an opening book from recorded games")
+    parser.add_argument('games', nargs='*', help="files with results of games (JSON lines, a JSON list or game records)")
+    parser.add_argument('--output', default='book.bin')
+    parser.add_argument('--plies', type=int, default=16, help="how many first moves of every game go to the book")
+    parser.add_argument('--min-games', type=int, default=1, help="leave out moves played in fewer games")
+    parser.add_argument('--show', help="print the moves of the starting position from this book")
+    args = parser.parse_args(arguments)
+
+    if args.show:
+        book = OpeningBook(args.show)
+        print("%d positions" % book.size)
+        for code, wins, draws, losses in book.lookup_key(Board().key):
+            print("%-20s %6d games: %6d wins %6d draws %6d losses" % (
+                ' '.join('%d %d' % (square // 10, square % 10) for square in code), wins + draws + losses, wins, draws, losses))
+        return
+    if not args.games:
+        parser.error("give files with games to build a book")
+
+    positions, games = collect(read_results(args.games), args.plies)
+    count = write_book(args.output, positions, args.min_games)
+    print("%d games, %d positions written to %s" % (games, count, args.output), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
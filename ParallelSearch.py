@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from Board import Board
+from Search import SearchBot, SearchTimeout, material_evaluation, INFINITY, WIN_THRESHOLD
+
+
+# ParallelSearchBot spreads the search of a single move over a pool of processes, using root splitting:
+# every iteration of iterative deepening searches the most promising root move first (so that a good alpha is known),
+# then the other root moves are searched in parallel, each by one worker. The workers share the best score found so far
+# (alpha) through shared memory, so every one of them searches with the best known bound.
+# Boards are sent to the workers in the compact form of serialize (50 bytes), never as pickled Pieces and Positions.
+# Every worker keeps its own SearchBot, with its transposition table, killer moves and history, between the tasks,
+# so the knowledge gathered in earlier iterations and moves isn't lost.
+# The time limit is kept: workers stop at the deadline and the best move of the last completed iteration is returned.
+# Root moves are sent to the workers as their indices in legal_moves() of the deserialized board, so the bot takes its
+# moves from a deserialized board too: legal_moves() of the board it was given may list them in another order.
+#
+#   python ParallelSearch.py --verify   - check on random positions that the moves found are scored like by SearchBot
+
+# The state of a worker process: its SearchBot, the shared alpha of the current iteration and the root board it searches
+_worker = None
+_shared_alpha = None
+_root = None
+
+# How long after the deadline we wait for the workers to report that they have stopped
+GRACE_PERIOD = 0.05
+
+
+def _init_worker(evaluate, tt_megabytes, tablebase, shared_alpha):
+    global _worker, _shared_alpha
+    _worker = SearchBot(evaluate, tt_megabytes=tt_megabytes, tablebase=tablebase)
+    _shared_alpha = shared_alpha
+
+
+# Search one root move (given by its index in legal_moves() of the board) in a worker process
+# Returns the index, the score (or None if the time was up) and the number of nodes searched
+def _search_root_move(board_class, data, index, depth, deadline):
+    global _root
+    bot = _worker
+    # A new root board means a new move: the transposition table and the move ordering tables age, like in SearchBot
+    if data != _root:
+        bot._new_search()
+        _root = data
+    bot.deadline = deadline
+    bot.nodes = 0
+    if time.time() >= deadline:
+        return index, None, 0
+
+    board = board_class.deserialize(data)
+    board.push(board.legal_moves()[index])
+    try:
+        # A null window search is enough to see that a move is worse than the best one found so far
+        alpha = _shared_alpha.value
+        score = None
+        if alpha > -INFINITY:
+            score = -bot._search(board, depth - 1, -alpha - 1, -alpha, 1)
+        if score is None or score > alpha:
+            score = -bot._search(board, depth - 1, -INFINITY, -alpha, 1)
+            with _shared_alpha.get_lock():
+                if score > _shared_alpha.value:
+                    _shared_alpha.value = score
+    except SearchTimeout:
+        return index, None, bot.nodes
+    return index, score, bot.nodes
+
+
+class ParallelSearchBot(SearchBot):
+    # workers - the number of processes (by default, one per core). The other arguments are the same as for SearchBot
+    # The evaluation function has to be defined at the top level of a module, so that the workers can get it
+    # A tablebase is opened again by every worker
+    def __init__(self, evaluate=material_evaluation, time_limit=1.0, max_depth=64, tt_megabytes=16, workers=None,
+                 tablebase=None):
+        SearchBot.__init__(self, evaluate, time_limit, max_depth, tt_megabytes, tablebase=tablebase)
+        self.workers = workers or os.cpu_count()
+        self.tt_megabytes = tt_megabytes
+        self.pool = None
+        self.shared_alpha = None
+
+
+    # Start the worker processes (it happens at the first move, so that creating a bot is cheap)
+    def start(self):
+        if self.pool is None:
+            context = multiprocessing.get_context()
+            self.shared_alpha = context.Value('q', -INFINITY)
+            self.pool = ProcessPoolExecutor(self.workers, context,
+                                            initializer=_init_worker,
+                                            initargs=(self.evaluate, self.tt_megabytes, self.tablebase, self.shared_alpha))
+
+
+    # Stop the worker processes
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+    # The workers can't go on with a search between the moves, so this bot doesn't ponder
+    def ponder(self, board):
+        pass
+
+
+    # Search the board for at most time_limit seconds and return the best move found
+    def search(self, board, time_limit):
+        start_time = time.time()
+        deadline = start_time + time_limit
+        board_class = type(board)
+        data = board.serialize()
+        # The same list of moves as in the workers
+        moves = board_class.deserialize(data).legal_moves()
+        best_index = 0
+        best_score = 0
+        completed_depth = 0
+        nodes = 0
+
+        if len(moves) > 1:
+            self.start()
+            # Root moves in the order in which they are searched: the best ones from the previous iteration first
+            order = list(range(len(moves)))
+            for depth in range(1, self.max_depth + 1):
+                self.shared_alpha.value = -INFINITY
+                scores = {}
+                # The first move is searched alone, the others wait for its score and are searched in parallel
+                first = [self.pool.submit(_search_root_move, board_class, data, order[0], depth, deadline)]
+                nodes += self._collect(first, deadline, scores)
+                if order[0] in scores:
+                    others = [self.pool.submit(_search_root_move, board_class, data, index, depth, deadline) for index in order[1:]]
+                    nodes += self._collect(others, deadline, scores)
+                if len(scores) < len(moves):
+                    break
+
+                order.sort(key=lambda index: scores[index], reverse=True)
+                best_index, best_score, completed_depth = order[0], scores[order[0]], depth
+                if abs(best_score) >= WIN_THRESHOLD:
+                    break
+
+        elapsed = time.time() - start_time
+        self.last_search = {
+            'nodes': nodes, 'depth': completed_depth, 'score': best_score, 'time': elapsed,
+            'nps': nodes / elapsed if elapsed > 0 else 0, 'workers': self.workers}
+        return moves[best_index] if moves else None
+
+
+    # Wait for the results of the searches (but not much longer than until the deadline) and put the scores of
+    # completed searches in scores. Returns the number of nodes searched
+    def _collect(self, futures, deadline, scores):
+        done, not_done = wait(futures, timeout=max(0, deadline - time.time()) + GRACE_PERIOD)
+        for future in not_done:
+            future.cancel()
+        nodes = 0
+        for future in done:
+            if future.cancelled():
+                continue
+            index, score, searched = future.result()
+            nodes += searched
+            if score is not None:
+                scores[index] = score
+        return nodes
+
+
+# The score of a move found by a search of the given depth, by a fresh SearchBot
+def score_move(board, move, depth):
+    bot = SearchBot()
+    bot.deadline = float('inf')
+    bot.nodes = 0
+    board = board.copy()
+    board.push(move)
+    return -bot._search(board, depth - 1, -INFINITY, INFINITY, 1)
+
+
+# Random positions for verify: boards after a random number of random moves, with at least two legal moves
+def random_positions(count, generator):
+    positions = []
+    while len(positions) < count:
+        board = Board()
+        for ply in range(generator.randrange(4, 60)):
+            moves = board.legal_moves()
+            if not moves:
+                break
+            board = board.make_move(generator.choice(moves))
+        # The workers don't get the history of the game, so the sequential search mustn't use it either. The pieces stay
+        # in the order which the moves left them in, as in real games
+        board.key_history = []
+        if len(board.legal_moves()) > 1:
+            positions.append(board)
+    return positions
+
+
+# Search random positions to the same depth with ParallelSearchBot and with SearchBot, and check that the move returned
+# by the parallel search has the root score of the sequential search. Returns the number of positions where it hasn't
+def verify(positions=30, depth=4, workers=2, seed=0, verbose=True):
+    parallel = ParallelSearchBot(time_limit=1e9, max_depth=depth, workers=workers)
+    errors = 0
+    try:
+        for number, board in enumerate(random_positions(positions, random.Random(seed))):
+            sequential = SearchBot(time_limit=1e9, max_depth=depth)
+            sequential.make_move(board)
+            expected = sequential.last_search['score']
+            move = parallel.make_move(board)
+            found = score_move(board, move, depth)
+            if found != expected or parallel.last_search['score'] != expected:
+                errors += 1
+                if verbose:
+                    print("position %d (%s): the move %s scores %d (reported %d), SearchBot's root score is %d" % (
+                        number, board.serialize().hex(), [(p.y, p.x) for p in move], found, parallel.last_search['score'],
+                        expected))
+    finally:
+        parallel.close()
+    print("%d positions, %d errors" % (positions, errors))
+    return errors
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Check ParallelSearchBot against SearchBot")
+    parser.add_argument('--verify', action='store_true', help="search random positions with both bots and compare them")
+    parser.add_argument('--positions', type=int, default=30)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(arguments)
+    if not args.verify:
+        parser.print_help()
+        return 0
+    return 1 if verify(args.positions, args.depth, args.workers, args.seed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from Board import Board
+from BitBoard import BitBoard
+
+
+# Perft (performance test) counts the positions which can be reached from a position in a given number of moves.
+# The counts depend on every detail of move generation, so comparing them with stored reference counts shows whether
+# a change of a board representation or of a move generator changed the rules; timing them shows how fast it is.
+#
+#   python Perft.py                      - count and time all the reference positions, compare with the reference counts
+#   python Perft.py --validate           - additionally check every generated move with make_move (slow)
+#   python Perft.py --record FILE        - append the timings to FILE (one JSON object per line), to follow them over time
+#   python Perft.py --update             - recompute the reference counts (only after a deliberate change of the rules!)
+#   python Perft.py --position start --depth 6 --divide   - counts for every move of a position
+#
+# The exit code is 1 if any count differs from the reference.
+
+# The file with the reference positions and their counts. Positions are written as 50 characters, one per dark square
+# (in the order of Board.SQUARES): '.' is an empty square, 'w' and 'W' a white man and king, 'b' and 'B' a black man and king
+# It's found next to this file, wherever perft is run from
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_reference.json')
+
+BACKENDS = {'board': Board, 'bitboard': BitBoard}
+
+CODES = '.wWbB'
+
+
+# Create a board of the given class from its 50 characters
+def board_from_string(text, board_class=Board):
+    if len(text) != 50 or any(c not in CODES for c in text):
+        raise ValueError("A position should have 50 characters from '" + CODES + "'", text)
+    return board_class.deserialize(bytes(CODES.index(c) for c in text))
+
+
+# Write a board as 50 characters
+def board_to_string(board):
+    return ''.join(CODES[code] for code in board.serialize())
+
+
+# Count the positions reached after depth moves
+def perft(board, depth):
+    moves = board.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+# Like perft, but also checks every generated move: make_move has to accept it and give the same position as push,
+# and the key kept by the board has to be the same as the key of the position made by make_move
+def perft_validate(board, depth):
+    if depth == 0:
+        return 1
+    moves = board.legal_moves()
+    if not moves and not board.white_lost():
+        raise AssertionError("No moves generated, but white_lost() is false", board_to_string(board))
+    nodes = 0
+    for move in moves:
+        made = board.make_move(move)
+        board.push(move)
+        if board.serialize() != made.serialize() or board.key != made.key:
+            raise AssertionError("push and make_move disagree", board_to_string(made), [(p.y, p.x) for p in move])
+        nodes += perft_validate(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+# The counts for every move of a position (useful to find which move is generated wrongly)
+def divide(board, depth):
+    counts = []
+    for move in board.legal_moves():
+        board.push(move)
+        counts += [(' '.join('%d %d' % (p.y, p.x) for p in move), perft(board, depth - 1))]
+        board.pop()
+    return counts
+
+
+def load_reference(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# The commit of the code being measured, if we are in a git repository
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Count and time move generation (perft)")
+    parser.add_argument('--reference', default=REFERENCE_FILE, help="file with the reference positions and counts")
+    parser.add_argument('--backend', choices=['board', 'bitboard', 'both'], default='both')
+    parser.add_argument('--position', help="only this position (its name in the reference file, or 50 characters)")
+    parser.add_argument('--depth', type=int, help="only up to this depth")
+    parser.add_argument('--divide', action='store_true', help="print the counts for every move at the deepest depth")
+    parser.add_argument('--validate', action='store_true', help="check every move with make_move")
+    parser.add_argument('--record', help="append the timings to this file")
+    parser.add_argument('--update', action='store_true', help="write the computed counts to the reference file")
+    args = parser.parse_args(arguments)
+
+    reference = load_reference(args.reference)
+    positions = reference['positions']
+    if args.position:
+        positions = [p for p in positions if p['name'] == args.position] or \
+                    [{'name': 'custom', 'board': args.position, 'counts': [], 'depth': args.depth or 1}]
+    backends = ['board', 'bitboard'] if args.backend == 'both' else [args.backend]
+
+    failed = False
+    records = []
+    for backend in backends:
+        for position in positions:
+            max_depth = args.depth or position['depth']
+            counts = []
+            for depth in range(1, max_depth + 1):
+                board = board_from_string(position['board'], BACKENDS[backend])
+                start_time = time.perf_counter()
+                nodes = perft_validate(board, depth) if args.validate else perft(board, depth)
+                elapsed = time.perf_counter() - start_time
+                counts += [nodes]
+
+                expected = position['counts'][depth - 1] if depth <= len(position['counts']) else None
+                status = '' if expected is None else ('ok' if expected == nodes else 'MISMATCH (expected %d)' % expected)
+                failed = failed or (expected is not None and expected != nodes)
+                print("%-9s %-20s depth %2d %12d nodes %8.3f s %10.0f nodes/s %s" % (
+                    backend, position['name'], depth, nodes, elapsed, nodes / elapsed if elapsed > 0 else 0, status))
+                records += [{'backend': backend, 'position': position['name'], 'depth': depth, 'nodes': nodes,
+                             'seconds': elapsed, 'validate': args.validate}]
+
+            if args.divide:
+                board = board_from_string(position['board'], BACKENDS[backend])
+                for move, nodes in divide(board, max_depth):
+                    print("    %-30s %d" % (move, nodes))
+            if args.update and position in reference['positions']:
+                position['counts'] = counts
+
+    if args.record:
+        commit = current_commit()
+        with open(args.record, 'a') as f:
+            for record in records:
+                record.update({'time': time.time(), 'commit': commit, 'python': platform.python_version()})
+                f.write(json.dumps(record) + '\n')
+    if args.update:
+        with open(args.reference, 'w') as f:
+            json.dump(reference, f, indent=2)
+            f.write('\n')
+
+    if failed:
+        print("Perft counts differ from the reference!")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
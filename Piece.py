@@ -1,13 +1,18 @@
-from Position import Position
+from Position import POSITIONS
 
 # A class to keep a piece
 # It stores its location, a boolean which us if its white and a boolean which tells us if it's a king
+# A piece on a Board also knows its index in the board's list of pieces of its colour, so it can be removed without
+# searching the list
 class Piece:
-    def __init__(self, white, king, y, x):
+    __slots__ = ('white', 'king', 'x', 'y', 'index')
+
+    def __init__(self, white, king, y, x, index=0):
         self.white = white
         self.king = king
         self.x = x
         self.y = y
+        self.index = index
     
     # Create a white piece on a given position
     @staticmethod
@@ -26,6 +31,6 @@ class Piece:
         self.x = 9 - self.x
         self.y = 9 - self.y
     
-    # Return piece's location as a Position class
+    # Return piece's location as a Position class (the shared Position of its square)
     def position(self):
-        return Position(self.y, self.x)
+        return POSITIONS[10 * self.y + self.x]
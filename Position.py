@@ -1,13 +1,32 @@
 # A class to keep pieces' positions on a board
 # Notice that when we create a Position, we firstly specify y and then x, unlike we are used to!
+# The 100 Positions of the squares of the board are created once and shared (see at): the boards return them in their
+# moves and add and middle return them, so Positions shouldn't be changed - create a new one instead
 class Position:
+    __slots__ = ('y', 'x')
+
     def __init__(self, y, x):
         self.y = y
         self.x = x
+    
+    # The shared Position of the square (y, x), or a new Position if (y, x) is outside the board
+    @staticmethod
+    def at(y, x):
+        if 0 <= y < 10 and 0 <= x < 10:
+            return POSITIONS[10 * y + x]
+        return Position(y, x)
         
     def add(self, y, x):
-        return Position(self.y + y, self.x + x)
+        y += self.y
+        x += self.x
+        if 0 <= y < 10 and 0 <= x < 10:
+            return POSITIONS[10 * y + x]
+        return Position(y, x)
     
     # Return a position in the middle between this position and another position
     def middle(self, other):
-        return Position(int((self.y+other.y)/2), int((self.x+other.x)/2))
+        return Position.at(int((self.y+other.y)/2), int((self.x+other.x)/2))
+
+
+# The Positions of all the squares: POSITIONS[10 * y + x] is the square (y, x)
+POSITIONS = [Position(y, x) for y in range(10) for x in range(10)]
@@ -0,0 +1,185 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from Board import Board, SQUARES, EMPTY, WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING
+from Position import Position
+
+
+# Drawing boards: fast frames for Board.show, and whole games exported to animated GIFs or sequences of PNG images.
+#
+# A Renderer draws everything once, when it's created: the background (the checkerboard) and a sprite for every kind of
+# dark square (empty, with a light or dark man, with a light or dark king). A frame is composed by copying sprites into
+# an array, and the renderer remembers the last frame, so the next one only redraws the squares which have changed
+# (after a move, two or three of them). Frames are kept as arrays of indices in PALETTE (one byte per pixel); they are
+# turned into colours only when they are shown, and they go straight to GIF and PNG images with a palette.
+# Boards are read through serialize, so both Board and BitBoard can be drawn.
+#
+#   python Renderer.py tournament.jsonl --game 3 --output game.gif   - a game from a file of results or of game records
+#   python Renderer.py games.bin --game 0 --output frames            - the same as PNG images in the directory frames
+
+# The colours: light squares, dark squares, light pieces and dark pieces (the first player's are light)
+PALETTE = np.array([(255, 255, 255), (0, 0, 0), (200, 255, 200), (0, 100, 0)], dtype=np.uint8)
+LIGHT_SQUARE, DARK_SQUARE, LIGHT_PIECE, DARK_PIECE = range(4)
+
+# Square codes of a board seen from the other side: the colours of the pieces are swapped
+SWAPPED = np.array([EMPTY, BLACK_MAN, BLACK_KING, WHITE_MAN, WHITE_KING])
+SQUARE_Y = np.array([y for (y, x) in SQUARES])
+SQUARE_X = np.array([x for (y, x) in SQUARES])
+
+
+class Renderer:
+    # size - the size of a square in pixels. Pieces are drawn as circles, kings with a smaller circle inside
+    def __init__(self, size=40):
+        self.size = size
+        squares = np.arange(10 * size) // size
+        self.background = np.where((squares[:, None] + squares[None, :]) % 2 == 0, DARK_SQUARE, LIGHT_SQUARE).astype(np.uint8)
+
+        # The sprites of dark squares, indexed by the square codes of serialize
+        pixels = np.arange(size) + 0.5 - size / 2
+        distance = pixels[:, None] ** 2 + pixels[None, :] ** 2
+        man = distance < (0.3 * size) ** 2
+        crown = distance < (0.1 * size) ** 2
+        self.sprites = np.full((5, size, size), DARK_SQUARE, dtype=np.uint8)
+        for code, colour, other in [(WHITE_MAN, LIGHT_PIECE, DARK_PIECE), (BLACK_MAN, DARK_PIECE, LIGHT_PIECE)]:
+            self.sprites[code][man] = colour
+            self.sprites[code + 1][man] = colour
+            self.sprites[code + 1][crown] = other
+
+        # The last frame and the square codes drawn on it
+        self.frame = None
+        self.squares = None
+
+
+    # The codes of the dark squares as they are drawn: from the board of the player who moves next, or turned around
+    # (the other player's view) if black_moves is true
+    @staticmethod
+    def square_codes(board, black_moves=False):
+        codes = np.frombuffer(board.serialize(), dtype=np.uint8)
+        if black_moves:
+            codes = SWAPPED[codes[::-1]]
+        return codes
+
+
+    # Draw a board (see square_codes) and return the frame: an array of indices in PALETTE. Only the squares which differ
+    # from the last frame are drawn. The frame is reused by the next call, so it has to be copied to be kept
+    def render(self, board, black_moves=False):
+        return self.render_codes(self.square_codes(board, black_moves))
+
+
+    # Draw the dark squares with the given codes
+    def render_codes(self, codes):
+        if self.frame is None:
+            self.frame = self.background.copy()
+            changed = range(50)
+        else:
+            changed = np.nonzero(codes != self.squares)[0]
+        size = self.size
+        for i in changed:
+            y, x = SQUARE_Y[i] * size, SQUARE_X[i] * size
+            self.frame[y:y + size, x:x + size] = self.sprites[codes[i]]
+        self.squares = codes.copy()
+        return self.frame
+
+
+    # The frame in colours (a (height, width, 3) array)
+    def rgb(self, frame=None):
+        return PALETTE[self.frame if frame is None else frame]
+
+
+    # The frame as a PIL image with the palette
+    @staticmethod
+    def image(frame):
+        from PIL import Image
+        image = Image.frombytes('P', (frame.shape[1], frame.shape[0]), frame.tobytes())
+        image.putpalette(PALETTE.flatten().tolist())
+        return image
+
+
+    # The frames of a game (as Game.result['moves']), always seen by the first player: the starting board and the board
+    # after every move. Frames are copied, so they can be kept
+    def game_frames(self, moves, board_class=Board):
+        board = board_class()
+        self.frame = None
+        yield self.render(board).copy()
+        for ply, move in enumerate(moves):
+            # A game lost by an illegal move ends with the board before it
+            try:
+                board = board.make_move([Position(point['y'], point['x']) for point in move])
+            except ValueError:
+                return
+            # After a move of the first player, its opponent moves next, so the board is turned around
+            yield self.render(board, ply % 2 == 0).copy()
+
+
+# The renderer used by Board.show, kept between the calls so that only changed squares are drawn
+_renderer = None
+
+
+# Display a board (see Board.show): in a notebook as an image, and outside of one as text
+def show(board, black_moves=False):
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    frame = _renderer.render(board, black_moves)
+    try:
+        from IPython import get_ipython
+        from IPython.display import display
+    except ImportError:
+        get_ipython = None
+    if get_ipython is not None and get_ipython() is not None:
+        display(Renderer.image(frame))
+    else:
+        print(text(_renderer.squares))
+
+
+# A board as text, one line per row: w and b for men, W and B for kings (of the light and dark player), . for dark squares
+def text(codes):
+    rows = [[' '] * 10 for y in range(10)]
+    for i, code in enumerate(codes):
+        rows[SQUARE_Y[i]][SQUARE_X[i]] = '.wWbB'[code]
+    return '\n'.join(' '.join(row) for row in rows)
+
+
+# Export a game (as Game.result['moves']) to an animated GIF (if the path ends with .gif), or to PNG images, one per
+# frame, in the directory path. duration is the time of a frame in milliseconds. Returns the number of frames
+def export_game(moves, path, size=40, duration=500, board_class=Board):
+    renderer = Renderer(size)
+    images = [Renderer.image(frame) for frame in renderer.game_frames(moves, board_class)]
+    if path.lower().endswith('.gif'):
+        # The last board stays a bit longer
+        durations = [duration] * (len(images) - 1) + [4 * duration]
+        images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0, optimize=False)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for number, image in enumerate(images):
+            image.save(os.path.join(path, 'frame_%04d.png' % number))
+    return len(images)
+
+
+def main(arguments=None):
+    from OpeningBook import read_results
+
+    parser = argparse.ArgumentParser(description="Export a recorded game to an animated GIF or PNG images")
+    parser.add_argument('games', help="a file with results of games (JSON lines, a JSON list or game records)")
+    parser.add_argument('--game', type=int, default=0, help="the number of the game in the file")
+    parser.add_argument('--output', default='game.gif', help="a .gif file or a directory for PNG images")
+    parser.add_argument('--size', type=int, default=40, help="the size of a square in pixels")
+    parser.add_argument('--duration', type=int, default=500, help="milliseconds per frame")
+    args = parser.parse_args(arguments)
+
+    games = 0
+    for result in read_results([args.games]):
+        if games == args.game:
+            frames = export_game(result['moves'], args.output, args.size, args.duration)
+            print("%d frames written to %s" % (frames, args.output), file=sys.stderr)
+            return 0
+        games += 1
+    print("There are only %d games in %s" % (games, args.games), file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
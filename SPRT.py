@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from Board import Board
+from TournamentRunner import play_game, parse_spec
+from TranspositionTable import encode_move
+
+
+# Match testing with a sequential probability ratio test: is a candidate bot stronger than a baseline?
+#
+# The bots play pairs of games: both games of a pair start from the same random opening, once with the candidate as white
+# and once as black, so neither the colours nor the openings favour one of them. After every game the Elo difference is
+# estimated (with a 95% confidence interval) and the test is updated; the match stops as soon as the test decides:
+#   H0: the candidate is elo0 Elo stronger than the baseline (by default 0 - it's no better),
+#   H1: the candidate is elo1 Elo stronger (by default 5),
+# with the probabilities alpha of accepting H1 when H0 is true and beta of accepting H0 when H1 is true.
+# The test is the generalized SPRT: the log-likelihood ratio of the two hypotheses, with the scores of the games (1, 1/2
+# or 0 for the candidate) approximated by a normal distribution with the variance measured in the match.
+# At the end the number of games is compared with a match of a fixed length which gives the same alpha and beta.
+#
+#   python SPRT.py new=Search:SearchBot:max_depth=5 old=Search:SearchBot:max_depth=4 --elo1 20 --workers 8
+
+# The number of games before the test may stop (the variance of the scores isn't known well before)
+MIN_GAMES = 10
+
+
+# The expected score of a player stronger by elo
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+# The Elo difference which gives the expected score
+def elo_difference(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+class SPRT:
+    def __init__(self, elo0=0, elo1=5, alpha=0.05, beta=0.05):
+        self.elo0, self.elo1 = elo0, elo1
+        self.alpha, self.beta = alpha, beta
+        # The test accepts H0 when the log-likelihood ratio falls to lower, and H1 when it reaches upper
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.wins = self.draws = self.losses = 0
+
+
+    # Add the result of a game: 1, 0.5 or 0 for the candidate
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+
+    # The mean and the variance of the scores of the games
+    # The variance counts one more win, draw and loss, so that it's never 0: after nothing but wins (or losses) the test
+    # still reaches a bound
+    def score(self):
+        games = self.games
+        mean = (self.wins + self.draws / 2) / games
+        variance = ((self.wins + 1) * (1 - mean) ** 2 + (self.draws + 1) * (0.5 - mean) ** 2 +
+                    (self.losses + 1) * mean ** 2) / (games + 3)
+        return mean, variance
+
+
+    # The log-likelihood ratio of H1 against H0
+    def llr(self):
+        if self.games == 0:
+            return 0
+        mean, variance = self.score()
+        s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+        return self.games * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+    # 'H0' or 'H1' when the test has decided, otherwise None
+    def decision(self):
+        if self.games < MIN_GAMES:
+            return None
+        llr = self.llr()
+        if llr <= self.lower:
+            return 'H0'
+        if llr >= self.upper:
+            return 'H1'
+        return None
+
+
+    # The estimated Elo difference and the bounds of its 95% confidence interval
+    def elo(self):
+        mean, variance = self.score()
+        margin = NormalDist().inv_cdf(0.975) * math.sqrt(variance / self.games)
+        return elo_difference(mean), elo_difference(mean - margin), elo_difference(mean + margin)
+
+
+    # The number of games of a match of a fixed length with the same alpha and beta (for the variance measured so far)
+    def fixed_games(self):
+        mean, variance = self.score()
+        z = NormalDist().inv_cdf(1 - self.alpha) + NormalDist().inv_cdf(1 - self.beta)
+        return math.ceil(variance * (z / (expected_score(self.elo1) - expected_score(self.elo0))) ** 2)
+
+
+    def report(self):
+        elo, low, high = self.elo()
+        return "%5d games  +%d =%d -%d  Elo %+.1f [%+.1f, %+.1f]  LLR %.2f [%.2f, %.2f]" % (
+            self.games, self.wins, self.draws, self.losses, elo, low, high, self.llr(), self.lower, self.upper)
+
+
+# A random opening: plies random legal moves from the starting board (in the form of Game.result['moves'])
+def random_opening(plies, generator):
+    board = Board()
+    moves = []
+    for ply in range(plies):
+        legal = sorted(board.legal_moves(), key=encode_move)
+        if not legal:
+            break
+        move = generator.choice(legal)
+        moves.append([{'y': point.y, 'x': point.x} for point in move])
+        board = board.make_move(move)
+    return moves[:len(moves) - len(moves) % 2]
+
+
+# Play the match until the test decides (or max_games are played). Games are played in pairs, at most two per worker at
+# a time; results are added as they come (all the games which have finished count, also those finished together with
+# the one which decided the test). records, if given, is a file where every game is written as a JSON line
+def run_match(test, candidate, baseline, workers, max_games, opening_plies=4, seed=None, options=None, records=None,
+              verbose=True):
+    generator = random.Random(seed)
+    options = options or {}
+    start_time = time.time()
+    scheduled = 0
+    with ProcessPoolExecutor(workers) as pool:
+        running = set()
+        while test.decision() is None and (scheduled < max_games or running):
+            while scheduled < max_games and len(running) < 2 * workers:
+                opening = random_opening(opening_plies, generator)
+                for white, black in [(candidate, baseline), (baseline, candidate)]:
+                    running.add(pool.submit(play_game, white, black, opening=opening, **options))
+                scheduled += 2
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                winner = record['winner']
+                candidate_colour = 'white' if record['white'] == candidate else 'black'
+                test.add(1 if winner == candidate_colour else 0.5 if winner == 'draw' else 0)
+                if records is not None:
+                    records.write(json.dumps(record) + '\n')
+                    records.flush()
+                if verbose:
+                    print(test.report(), file=sys.stderr)
+        # Games which haven't started yet are not needed any more; those already being played are finished
+        for future in running:
+            future.cancel()
+    return time.time() - start_time
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Test whether a candidate bot is stronger than a baseline")
+    parser.add_argument('candidate', help="the candidate bot, as [name=]module:Class[:key=value,...]")
+    parser.add_argument('baseline', help="the baseline bot")
+    parser.add_argument('--elo0', type=float, default=0, help="the Elo difference of H0")
+    parser.add_argument('--elo1', type=float, default=5, help="the Elo difference of H1")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--max-games', type=int, default=20000, help="stop without a decision after this many games")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument('--opening-plies', type=int, default=4, help="random moves at the start of every pair of games")
+    parser.add_argument('--seed', type=int, help="seed of the openings")
+    parser.add_argument('--output', help="file where the records of games are written (JSON lines)")
+    parser.add_argument('--bitboard', action='store_true', help="give the bots BitBoards instead of Boards")
+    parser.add_argument('--tablebase', help="adjudicate games with this tablebase file (see Tablebase.py)")
+    parser.add_argument('--time-per-move', type=float, help="seconds per move (the bots play in their own processes)")
+    parser.add_argument('--quiet', action='store_true', help="don't report every finished game")
+    args = parser.parse_args(arguments)
+
+    for bot in (args.candidate, args.baseline):
+        parse_spec(bot)
+    if args.candidate == args.baseline:
+        parser.error("the candidate and the baseline have to be different (use name= to test a bot against itself)")
+    if args.elo1 <= args.elo0:
+        parser.error("elo1 has to be larger than elo0")
+
+    test = SPRT(args.elo0, args.elo1, args.alpha, args.beta)
+    options = {'use_bitboard': args.bitboard, 'tablebase': args.tablebase,
+               'time_control': (args.time_per_move, None, 0) if args.time_per_move else None}
+    records = open(args.output, 'a') if args.output else None
+    try:
+        elapsed = run_match(test, args.candidate, args.baseline, args.workers, args.max_games, args.opening_plies,
+                            args.seed, options, records, not args.quiet)
+    finally:
+        if records is not None:
+            records.close()
+
+    decision = test.decision()
+    print()
+    print(test.report())
+    if decision is None:
+        print("No decision after %d games" % test.games)
+    else:
+        print("%s accepted: the candidate is %s" % (decision, "stronger" if decision == 'H1' else "not stronger"))
+    if test.games:
+        fixed = test.fixed_games()
+        print("%d games in %.1f s; a match of a fixed length with the same error rates needs %d games (%d games saved)" % (
+            test.games, elapsed, fixed, fixed - test.games))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import time
+import threading
+
+from TranspositionTable import TranspositionTable, EXACT, LOWER, UPPER, encode_move
+from Board import MEN, KINGS, ADVANCEMENT, OPPONENT
+
+
+# A reusable search engine for bots. SearchBot is a bot (it has make_move(self, board), see Game.py), which chooses its moves
+# with a negamax alpha-beta search:
+# - principal variation search: the first move is searched with the full window, the others with a null window first,
+# - iterative deepening with aspiration windows around the score of the previous iteration,
+# - quiescence search: at the end of the main search, capture sequences are played out until the position is quiet,
+# - move ordering: the best move from the transposition table first, then killer moves and the history heuristic,
+# - a transposition table shared between iterations and moves of the game,
+# - a hard deadline: when the time is up, the best move of the last completed iteration is returned,
+# - optionally, endgame tablebases (see Tablebase.py): positions found in them get their exact scores without searching,
+# - pondering: after its move, the bot can go on thinking on the opponent's time (see ponder),
+# - repeated positions (earlier in the game or in the searched line) are scored as draws.
+# The board is searched in place with push and pop, so it works with both Board and BitBoard.
+
+# The evaluation function is pluggable: it gets a board and returns its score (in hundredths of a man) for the player
+# who moves next (white). It is only called for quiet positions (with no capture possible).
+
+# Score of a won position. Wins which come sooner get higher scores: a position where white has lost scores -WIN + ply
+WIN = 100000
+INFINITY = 1000000
+# Scores this close to WIN mean that the game is decided
+WIN_THRESHOLD = WIN - 1000
+
+# How often (in nodes) we check whether the time is up
+TIME_CHECK_INTERVAL = 256
+
+
+# Raised inside the search when the deadline has passed
+class SearchTimeout(Exception):
+    pass
+
+
+# The default evaluation: material (a king is worth three men) and a small bonus for men which have advanced
+# It only reads the features which the board keeps up to date (see Board.features)
+def material_evaluation(board):
+    features = board.features()
+    return (100 * (features[MEN] - features[OPPONENT + MEN]) + 300 * (features[KINGS] - features[OPPONENT + KINGS]) +
+            2 * (features[ADVANCEMENT] - features[OPPONENT + ADVANCEMENT]))
+
+
+# Scores of won positions depend on the distance from the root, so in the transposition table we keep them relative
+# to the position where they are stored
+def score_to_table(score, ply):
+    if score >= WIN_THRESHOLD:
+        return score + ply
+    if score <= -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= WIN_THRESHOLD:
+        return score - ply
+    if score <= -WIN_THRESHOLD:
+        return score + ply
+    return score
+
+
+# The score of a result found in a tablebase: the game ends after distance more plies
+# Tablebase.py is imported only when a tablebase is used, so that bots without one don't load it
+def tablebase_score(found, ply):
+    from Tablebase import WON, LOST
+    result, distance = found
+    if result == WON:
+        return WIN - ply - distance
+    if result == LOST:
+        return -WIN + ply + distance
+    return 0
+
+
+class SearchBot:
+    # evaluate - the evaluation function, time_limit - seconds per move, max_depth - the deepest iteration,
+    # tt_megabytes - the size of the transposition table, aspiration_window - the half-width of the aspiration window,
+    # tablebase - a Tablebase, or the path of a tablebase file (or None)
+    def __init__(self, evaluate=material_evaluation, time_limit=1.0, max_depth=64, tt_megabytes=16, aspiration_window=50,
+                 tablebase=None):
+        self.evaluate = evaluate
+        self.tablebase = tablebase
+        # A tablebase opened from its path belongs to the bot, which closes it in close
+        self.own_tablebase = isinstance(tablebase, str)
+        if self.own_tablebase:
+            from Tablebase import Tablebase
+            self.tablebase = Tablebase(tablebase)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.aspiration_window = aspiration_window
+        self.tt = TranspositionTable(tt_megabytes)
+        self.killers = []
+        self.history = {}
+        self.deadline = None
+        self.nodes = 0
+        self.hits_before = 0
+        # The last completed iteration of the current search: (depth, score, move)
+        self.progress = (0, 0, None)
+        # Pondering: the thread searching on the opponent's time and the board it searches (after the guessed reply)
+        self.ponder_thread = None
+        self.ponder_board = None
+        # Statistics of the last search: nodes, depth, score, time, nodes per second and transposition table hits
+        # (and, if the bot was pondering, whether it guessed the opponent's move)
+        self.last_search = {}
+
+
+    # Choose a move for the given board. If the bot was pondering on this very board, the search goes on from where
+    # pondering got to (a ponder hit); otherwise what was found while pondering is thrown away (a ponder miss), except for
+    # the entries of the transposition table, which stay true for any position
+    def make_move(self, board):
+        start_time = time.time()
+        pondered, progress = self.stop_pondering()
+        if pondered is None:
+            return self.search(board, self.time_limit)
+        hit = pondered.serialize() == board.serialize()
+        ponder_nodes, ponder_depth = self.nodes, progress[0]
+        # The time it took to stop pondering counts
+        move = self.search(board, self.time_limit - (time.time() - start_time), progress if hit else None)
+        self.last_search.update(ponder_hit=hit, ponder_nodes=ponder_nodes, ponder_depth=ponder_depth)
+        return move
+
+
+    # Search the board for at most time_limit seconds and return the best move found
+    # progress - the last completed iteration of an earlier search of the same board, to go on from
+    def search(self, board, time_limit, progress=None):
+        start_time = time.time()
+        self.deadline = start_time + time_limit
+        self.nodes = 0
+        self.hits_before = self.tt.hits
+        if progress is None:
+            self._new_search()
+        # The search changes the board in place, so we work on our own copy
+        return self._iterate(board.copy(), start_time, progress)
+
+
+    # Get ready for the search of a new board
+    def _new_search(self):
+        self.tt.new_search()
+        self.killers = []
+        # Old history scores are halved, so that they count less than the new ones
+        for move in self.history:
+            self.history[move] //= 2
+
+
+    # Iterative deepening, until the deadline or until the game is decided. Every completed iteration is kept in progress
+    def _iterate(self, board, start_time, progress=None):
+        moves = board.legal_moves()
+        completed_depth, best_score, best_move = progress or (0, 0, moves[0] if moves else None)
+        self.progress = (completed_depth, best_score, best_move)
+        # There is no point in searching deeper if the game is already decided
+        if len(moves) > 1 and abs(best_score) < WIN_THRESHOLD:
+            for depth in range(completed_depth + 1, self.max_depth + 1):
+                try:
+                    score, move = self._aspiration_search(board, depth, best_score)
+                except SearchTimeout:
+                    break
+                best_score, best_move, completed_depth = score, move, depth
+                self.progress = (completed_depth, best_score, best_move)
+                if abs(best_score) >= WIN_THRESHOLD:
+                    break
+
+        elapsed = time.time() - start_time
+        self.last_search = {
+            'nodes': self.nodes, 'depth': completed_depth, 'score': best_score, 'time': elapsed,
+            'nps': self.nodes / elapsed if elapsed > 0 else 0, 'tt_hits': self.tt.hits - self.hits_before}
+        return best_move
+
+
+    # Think on the opponent's time. board is the board after the bot's move (the opponent moves next). The bot guesses
+    # the opponent's reply (its best move in the transposition table, found by the search of the bot's own move) and
+    # searches the board after it in a background thread, until the next make_move (or stop_pondering)
+    # Pondering only pays off when the bot has a core of its own, e.g. when it plays in a BotProcess (see BotProcess.py)
+    def ponder(self, board):
+        self.stop_pondering()
+        entry = self.tt.probe(board.key)
+        if entry is None or entry[4] is None:
+            return
+        replies = [move for move in board.legal_moves() if encode_move(move) == entry[4]]
+        if not replies:
+            return
+
+        board = board.copy()
+        board.push(replies[0])
+        self.ponder_board = board.copy()
+        self.nodes = 0
+        self._new_search()
+        # There is no deadline: stop_pondering ends the search by moving the deadline to the past
+        self.deadline = float('inf')
+        self.ponder_thread = threading.Thread(target=self._iterate, args=(board, time.time()), daemon=True)
+        self.ponder_thread.start()
+
+
+    # Stop pondering. Returns the board which was pondered and the last iteration completed on it (or None, None)
+    def stop_pondering(self):
+        if self.ponder_thread is None:
+            return None, None
+        self.deadline = 0
+        self.ponder_thread.join()
+        pondered, progress = self.ponder_board, self.progress
+        self.ponder_thread = self.ponder_board = None
+        return pondered, progress
+
+
+    # Stop pondering and close the tablebase the bot opened itself
+    def close(self):
+        self.stop_pondering()
+        if self.own_tablebase:
+            self.tablebase.close()
+            self.tablebase = None
+            self.own_tablebase = False
+
+
+    # Search the root to the given depth, first with a narrow window around the previous score, widening it if the score
+    # falls outside. Returns the score and the best move
+    def _aspiration_search(self, board, depth, previous_score):
+        if depth < 3 or abs(previous_score) >= WIN_THRESHOLD:
+            alpha, beta = -INFINITY, INFINITY
+        else:
+            alpha, beta = previous_score - self.aspiration_window, previous_score + self.aspiration_window
+
+        while True:
+            score, move = self._root(board, depth, alpha, beta)
+            if score <= alpha:
+                alpha = -INFINITY
+            elif score >= beta:
+                beta = INFINITY
+            else:
+                return score, move
+
+
+    # Search the root position. Works like _search, but also returns the best move
+    def _root(self, board, depth, alpha, beta):
+        original_alpha = alpha
+        entry = self.tt.probe(board.key)
+        moves = self._order_moves(board.legal_moves(), entry[4] if entry else None, 0)
+        best_score = -INFINITY
+        best_move = moves[0]
+        for i, move in enumerate(moves):
+            board.push(move)
+            if i == 0:
+                score = -self._search(board, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self._search(board, depth - 1, -alpha - 1, -alpha, 1)
+                if alpha < score < beta:
+                    score = -self._search(board, depth - 1, -beta, -alpha, 1)
+            board.pop()
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(board.key, depth, score_to_table(best_score, 0), bound, encode_move(best_move))
+        return best_score, best_move
+
+
+    # Negamax alpha-beta search with principal variation search. Returns the score of the board for white
+    def _search(self, board, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and time.time() >= self.deadline:
+            raise SearchTimeout()
+
+        # A position which occurred before can be repeated again and again, so it's a draw
+        if board.key_history and board.repetitions():
+            return 0
+
+        if self.tablebase is not None:
+            found = self.tablebase.probe(board)
+            if found is not None:
+                return tablebase_score(found, ply)
+
+        original_alpha = alpha
+        key = board.key
+        entry = self.tt.probe(key)
+        table_move = None
+        if entry is not None:
+            table_move = entry[4]
+            if entry[1] >= depth:
+                score = score_from_table(entry[2], ply)
+                if entry[3] == EXACT:
+                    return score
+                if entry[3] == LOWER and score >= beta:
+                    return score
+                if entry[3] == UPPER and score <= alpha:
+                    return score
+
+        moves = board.legal_moves()
+        if not moves:
+            return -WIN + ply
+        capturing = board.capture_possible()
+
+        best_score = -INFINITY
+        best_move = None
+        for i, move in enumerate(self._order_moves(moves, table_move, ply)):
+            board.push(move)
+            if i == 0:
+                score = -self._search(board, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self._search(board, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self._search(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not capturing:
+                    self._remember_cutoff(move, depth, ply)
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.tt.store(key, depth, score_to_table(best_score, ply), bound, encode_move(best_move))
+        return best_score
+
+
+    # Search only capture sequences, until the position is quiet. Captures are mandatory, so when a capture is possible
+    # white cannot just stop and take the evaluation of the position
+    def _quiescence(self, board, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0 and time.time() >= self.deadline:
+            raise SearchTimeout()
+
+        if not board.capture_possible():
+            if not board.normal_move_possible():
+                return -WIN + ply
+            return self.evaluate(board)
+
+        best_score = -INFINITY
+        for move in sorted(board.legal_moves(), key=len, reverse=True):
+            board.push(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+        return best_score
+
+
+    # A quiet move caused a cutoff: remember it as a killer move at this ply and increase its history score
+    def _remember_cutoff(self, move, depth, ply):
+        code = encode_move(move)
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if code not in killers:
+            killers.insert(0, code)
+            del killers[2:]
+        self.history[code] = self.history.get(code, 0) + depth * depth
+
+
+    # Order the moves: the best move from the transposition table, killer moves, then by history scores
+    # (longer capture sequences go first among captures)
+    def _order_moves(self, moves, table_move, ply):
+        killers = self.killers[ply] if ply < len(self.killers) else []
+
+        def priority(move):
+            code = encode_move(move)
+            if code == table_move:
+                return 3 * INFINITY
+            if code in killers:
+                return 2 * INFINITY - killers.index(code)
+            return 100 * len(move) + self.history.get(code, 0)
+
+        return sorted(moves, key=priority, reverse=True)
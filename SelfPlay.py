@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from Board import Board
+from BitBoard import BitBoard
+from Game import Game
+from Position import Position
+from Encoding import encode
+from TournamentRunner import create_bot, parse_spec
+
+
+# Self-play: generating training data for learned evaluation functions.
+#
+# Games between two bots are played in a pool of processes. To make the games (and so the data) more varied, the first
+# moves of every game can be random and afterwards every move can be random with probability epsilon.
+# Every position visited in a game becomes one row of data:
+#   board  - the board as 50 square codes seen by the player who moves (see Encoding.encode),
+#   side   - who moves: 0 - white, 1 - black,
+#   result - how the game ended for the player who moves: 1 - a win, 0 - a draw, -1 - a loss,
+#   score  - the score of the search of the bot which moved (in hundredths of a man, for the player who moves),
+#            or NaN if the move was random, forced (SearchBot doesn't search when there is only one legal move) or the
+#            bot doesn't report scores.
+# The rows are written to shards: .npy files with room for shard_size rows, created at full size at once and written
+# through numpy memory maps, in batches. A JSON file of metadata keeps how many rows every shard holds and which games
+# were played (games are numbered, and the seed of a game depends on its number), so the data is never held in memory and
+# an interrupted run goes on from where it stopped when it's started again with the same output directory: it plays exactly
+# the games which are missing, even though games finish out of order.
+#
+#   python SelfPlay.py Search:SearchBot:time_limit=0.05 --games 1000 --epsilon 0.05 --random-plies 4 --output selfplay
+#   python SelfPlay.py Search:SearchBot Search:SearchBot:max_depth=4 --games 500 --workers 8
+
+# One row of data
+ROW = np.dtype([('board', np.int8, 50), ('side', np.int8), ('result', np.int8), ('score', np.float32)])
+METADATA = 'selfplay.json'
+# How often (in seconds) the progress is reported
+REPORT_INTERVAL = 10
+
+
+# A bot which makes random moves at the start of a game and with probability epsilon later on, and otherwise lets
+# another bot choose its moves. The bot is created for a single game
+class ExplorationBot:
+    def __init__(self, bot, epsilon=0.0, random_plies=0, seed=None):
+        self.bot = bot
+        self.epsilon = epsilon
+        self.random_plies = random_plies
+        self.random = random.Random(seed)
+        self.moves_made = 0
+        self.last_search = {}
+
+
+    def make_move(self, board):
+        self.moves_made += 1
+        if self.moves_made <= self.random_plies or self.random.random() < self.epsilon:
+            self.last_search = {'random': True}
+            return self.random.choice(board.legal_moves())
+        move = self.bot.make_move(board)
+        self.last_search = dict(getattr(self.bot, 'last_search', {}) or {})
+        return move
+
+
+    def close(self):
+        if hasattr(self.bot, 'close'):
+            self.bot.close()
+
+
+# The score of a move's search, or NaN if the move was random or no search was made (a forced move is played at depth 0)
+def search_score(search):
+    if search.get('random') or search.get('depth', 1) == 0:
+        return np.nan
+    return search.get('score', np.nan)
+
+
+# Play one game in a worker process and turn it into rows of data. Returns the rows (or None if a bot crashed)
+# random_plies is the number of random moves of each player at the start of the game
+def play_game(white_spec, black_spec, epsilon, random_plies, seed, use_bitboard=False):
+    white = ExplorationBot(create_bot(white_spec), epsilon, random_plies, seed)
+    black = ExplorationBot(create_bot(black_spec), epsilon, random_plies, None if seed is None else seed + 1)
+    board_class = BitBoard if use_bitboard else Board
+    game = Game(white, black, board_class, verbose=False)
+    game.move_length = 0
+    try:
+        result = game.play_bots(draw_board=False)
+    except Exception:
+        return None
+    finally:
+        white.close()
+        black.close()
+    if result['reason'] == 'illegal move':
+        return None
+
+    # The positions are replayed from the moves; a position is the board before every move
+    boards = []
+    board = board_class()
+    for move in result['moves']:
+        boards.append(board)
+        board = board.make_move([Position(point['y'], point['x']) for point in move])
+    rows = np.zeros(len(boards), dtype=ROW)
+    if not boards:
+        return rows
+    rows['board'] = encode(boards)
+    rows['side'] = np.arange(len(boards)) % 2
+    if result['winner']:
+        winner_side = 0 if result['winner'] == 'white' else 1
+        rows['result'] = np.where(rows['side'] == winner_side, 1, -1)
+    rows['score'] = [search_score(stats.get('search', {})) for stats in result['stats'][:len(boards)]]
+    return rows
+
+
+# Writes rows to shards in a directory, through memory maps. The rows of finished games are collected in a buffer of
+# batch_size rows and copied to the shards when the next game doesn't fit in it (or on flush). The metadata is saved after
+# every write, when all the rows of the games it counts are in the shards, so the files always agree with it: rows written
+# after the last save of the metadata are simply written again when the run goes on
+class ShardWriter:
+    def __init__(self, directory, shard_size=1000000, batch_size=10000, description=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.metadata = load_metadata(directory)
+        if self.metadata is None:
+            self.metadata = {'shard_size': shard_size, 'shards': [], 'games': 0, 'failed_games': 0, 'positions': 0,
+                             'description': description or {}}
+        # The numbers of the finished games: all those below finished_below, and the ones in finished_above
+        # (games which finished before some games with lower numbers)
+        self.metadata.setdefault('finished_below', self.metadata['games'])
+        self.metadata.setdefault('finished_above', [])
+        self.shard_size = self.metadata['shard_size']
+        self.buffer = np.zeros(batch_size, dtype=ROW)
+        self.buffered = 0
+        self.games_buffered = 0
+        # The numbers of the games in the buffer
+        self.numbers_buffered = []
+        self.shard = None
+
+
+    # The number of games played (with the failed ones), with those still in the buffer
+    @property
+    def games(self):
+        return self.metadata['games'] + self.games_buffered
+
+
+    # The numbers of the games below games which haven't finished yet, in order
+    def missing(self, games):
+        finished = set(self.metadata['finished_above']) | set(self.numbers_buffered)
+        return [number for number in range(self.metadata['finished_below'], games) if number not in finished]
+
+
+    # Add the rows of a finished game (number is the number of the game)
+    def add(self, rows, number=None):
+        if self.buffered + len(rows) > len(self.buffer):
+            self.flush()
+        if len(rows) > len(self.buffer):
+            self._write(rows)
+        else:
+            self.buffer[self.buffered:self.buffered + len(rows)] = rows
+            self.buffered += len(rows)
+        self._count(number)
+
+
+    # Count a game which failed (a bot crashed or made an illegal move)
+    def add_failed(self, number=None):
+        self.metadata['failed_games'] += 1
+        self._count(number)
+
+
+    # Count a finished game, and remember its number
+    def _count(self, number):
+        self.games_buffered += 1
+        if number is not None:
+            self.numbers_buffered.append(number)
+
+
+    # Write the buffer to the shards and save the metadata
+    def flush(self):
+        self._write(self.buffer[:self.buffered])
+        self.buffered = 0
+        self._save()
+
+
+    def close(self):
+        self.flush()
+        self.shard = None
+
+
+    # The memory map of the last shard, with room for more rows (a new shard is created when the last one is full)
+    def _open_shard(self):
+        shards = self.metadata['shards']
+        if not shards or shards[-1]['rows'] == self.shard_size:
+            shards.append({'file': 'shard_%05d.npy' % len(shards), 'rows': 0})
+            self.shard = open_memmap(os.path.join(self.directory, shards[-1]['file']), mode='w+', dtype=ROW,
+                                     shape=(self.shard_size,))
+        elif self.shard is None:
+            self.shard = open_memmap(os.path.join(self.directory, shards[-1]['file']), mode='r+')
+        return shards[-1]
+
+
+    # Copy rows to the shards
+    def _write(self, rows):
+        written = 0
+        while written < len(rows):
+            shard = self._open_shard()
+            count = min(len(rows) - written, self.shard_size - shard['rows'])
+            self.shard[shard['rows']:shard['rows'] + count] = rows[written:written + count]
+            shard['rows'] += count
+            written += count
+            if shard['rows'] == self.shard_size:
+                self.shard.flush()
+                self.shard = None
+        if self.shard is not None:
+            self.shard.flush()
+        self.metadata['positions'] += len(rows)
+
+
+    # Save the metadata (to another file first, so that an interrupted save doesn't destroy it)
+    def _save(self):
+        self.metadata['games'] += self.games_buffered
+        self.games_buffered = 0
+        finished = set(self.metadata['finished_above']) | set(self.numbers_buffered)
+        below = self.metadata['finished_below']
+        while below in finished:
+            finished.remove(below)
+            below += 1
+        self.metadata['finished_below'] = below
+        self.metadata['finished_above'] = sorted(finished)
+        self.numbers_buffered = []
+        path = os.path.join(self.directory, METADATA)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.metadata, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+
+# The metadata of a directory of shards, or None if there is none yet
+def load_metadata(directory):
+    path = os.path.join(directory, METADATA)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# The data of a directory of shards: a list of read-only memory maps, one per shard, cut to the rows written
+def read_shards(directory):
+    metadata = load_metadata(directory)
+    if metadata is None:
+        raise ValueError("Not a directory of self-play data", directory)
+    return [np.load(os.path.join(directory, shard['file']), mmap_mode='r')[:shard['rows']] for shard in metadata['shards']]
+
+
+# Play the games numbered below games which the writer doesn't have yet (failed games count too). At most two games per
+# worker are in flight at a time, so results never pile up in memory
+def generate(writer, white_spec, black_spec, games, workers, epsilon, random_plies, seed=None, use_bitboard=False,
+             verbose=True):
+    start_time = last_report = time.time()
+    positions_before = writer.metadata['positions']
+    missing = writer.missing(games)
+    next_game = 0
+    with ProcessPoolExecutor(workers) as pool:
+        running = {}
+        while next_game < len(missing) or running:
+            while next_game < len(missing) and len(running) < 2 * workers:
+                # The seed of a game depends on its number, so a resumed run plays the same games as an uninterrupted one
+                number = missing[next_game]
+                game_seed = None if seed is None else seed + 2 * number
+                future = pool.submit(play_game, white_spec, black_spec, epsilon, random_plies, game_seed, use_bitboard)
+                running[future] = number
+                next_game += 1
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                rows = future.result()
+                number = running.pop(future)
+                if rows is None:
+                    writer.add_failed(number)
+                else:
+                    writer.add(rows, number)
+
+            if verbose and time.time() - last_report >= REPORT_INTERVAL:
+                last_report = time.time()
+                report(writer, positions_before, start_time)
+    writer.flush()
+    if verbose:
+        report(writer, positions_before, start_time)
+
+
+# Print the number of games and positions and the speed of generating them
+def report(writer, positions_before, start_time):
+    elapsed = time.time() - start_time
+    positions = writer.metadata['positions'] + writer.buffered
+    print("%d games, %d positions (%d failed games): %.0f positions/s" % (
+        writer.games, positions, writer.metadata['failed_games'],
+        (positions - positions_before) / elapsed if elapsed > 0 else 0), file=sys.stderr)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate training data from games of bots against each other")
+    parser.add_argument('bots', nargs='+', help="one bot (playing itself) or two bots, as module:Class[:key=value,...]")
+    parser.add_argument('--games', type=int, default=100, help="the number of games (in total, with earlier runs)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument('--output', default='selfplay', help="the directory of the shards and the metadata")
+    parser.add_argument('--shard-size', type=int, default=1000000, help="rows per shard")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows written to the shards at once")
+    parser.add_argument('--epsilon', type=float, default=0.0, help="the probability of a random move")
+    parser.add_argument('--random-plies', type=int, default=0, help="random moves of every player at the start of a game")
+    parser.add_argument('--seed', type=int, help="seed of the random moves")
+    parser.add_argument('--bitboard', action='store_true', help="give the bots BitBoards instead of Boards")
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(arguments)
+
+    if len(args.bots) > 2:
+        parser.error("give one or two bots")
+    for bot in args.bots:
+        parse_spec(bot)
+    white_spec, black_spec = args.bots[0], args.bots[-1]
+    description = {'white': white_spec, 'black': black_spec, 'epsilon': args.epsilon, 'random_plies': args.random_plies,
+                   'seed': args.seed}
+    writer = ShardWriter(args.output, args.shard_size, args.batch_size, description)
+    if writer.metadata['description'] != description:
+        print("warning: %s was generated with %s" % (args.output, writer.metadata['description']), file=sys.stderr)
+    generate(writer, white_spec, black_spec, args.games, args.workers, args.epsilon, args.random_plies, args.seed,
+             args.bitboard, not args.quiet)
+    writer.close()
+
+
+if __name__ == '__main__':
+    main()
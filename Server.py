@@ -0,0 +1,387 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+from Board import Board
+from BitBoard import BitBoard
+from Engine import Engine
+from Position import Position
+from GameRecord import GameWriter
+from TournamentRunner import create_bot, parse_spec
+
+
+# A game server: many games at once (humans against bots, bots against bots) in one process, with asyncio.
+#
+# Clients connect over TCP (or a Unix socket) and talk in JSON, one object per line. Every game is a coroutine driving an
+# Engine; the moves of bots are computed in a pool of processes of a fixed size, so the event loop never waits for a bot.
+# Moves are written like in Game.human_move: the squares of the path as "y x y x ...", always in the coordinates of the
+# white player (so black's moves aren't turned around).
+#
+# Requests of a client:
+#   {"type": "new", "white": "human", "black": "Search:SearchBot:time_limit=0.1"}   - start a game; every player is either
+#                                                      "human" (the moves come from this client) or a bot spec (see
+#                                                      TournamentRunner.py)
+#   {"type": "move", "game": 3, "move": "2 0 3 1"}   - make a move of a human player
+#   {"type": "resign", "game": 3}
+#   {"type": "stats"}                                - games in flight, latencies of moves and the queue of bot moves
+# Messages of the server:
+#   {"type": "started", "game": 3, "white": ..., "black": ...}
+#   {"type": "your_move", "game": 3, "player": "white", "legal": ["2 0 3 1", ...]}
+#   {"type": "moved", "game": 3, "player": "black", "move": "6 1 5 0"}
+#   {"type": "illegal", "game": 3, "message": ...}   - the move wasn't made, the player moves again
+#   {"type": "end", "game": 3, "winner": "white", "reason": "no moves"}   - winner is "" for a draw
+#   {"type": "stats", ...}, {"type": "error", "message": ...}
+#
+#   python Server.py serve --port 8765 --workers 4 --records games.bin
+#   python Server.py load --port 8765 --players 300 --bot Search:SearchBot:max_depth=2
+
+# How many latencies are kept for the percentiles
+LATENCY_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+
+# The bots of a worker process, by spec. They are created at their first move and kept, with their state
+_bots = {}
+
+
+# Compute a move of a bot in a worker process. The move is returned as (y, x) pairs, in the coordinates of the bot
+def _bot_move(spec, board_class, data):
+    if spec not in _bots:
+        _bots[spec] = create_bot(spec)
+    move = _bots[spec].make_move(board_class.deserialize(data))
+    return tuple((point.y, point.x) for point in move)
+
+
+# Turn a move given in the coordinates of the player into text in the coordinates of white, and back
+def move_to_text(move, white):
+    return ' '.join('%d %d' % ((y, x) if white else (9 - y, 9 - x)) for (y, x) in move)
+
+
+def text_to_move(text, white):
+    numbers = [int(number) for number in text.split()]
+    if len(numbers) % 2:
+        raise ValueError("A move should be given as pairs of numbers: y x y x ...")
+    return [Position(y, x) if white else Position(9 - y, 9 - x) for (y, x) in zip(numbers[::2], numbers[1::2])]
+
+
+# Percentiles of a list of numbers (None if it's empty)
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {'p%d' % p: values[min(len(values) - 1, len(values) * p // 100)] for p in PERCENTILES}
+
+
+class GameSession:
+    def __init__(self, number, white, black, send, board_class):
+        self.number = number
+        self.players = {True: white, False: black}
+        self.send = send
+        self.engine = Engine(board_class, verbose=False)
+        # Moves of human players (as text), waiting to be made
+        self.human_moves = asyncio.Queue()
+        self.result = {'moves': [], 'winner': '', 'reason': ''}
+
+
+    def is_human(self, white):
+        return self.players[white] == 'human'
+
+
+class GameServer:
+    # workers - the number of processes computing the moves of bots, max_games - how many games can be played at once,
+    # records - a GameWriter (see GameRecord.py) where finished games are written
+    def __init__(self, workers=None, max_games=1000, board_class=Board, records=None):
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count())
+        self.workers = workers or os.cpu_count()
+        self.max_games = max_games
+        self.board_class = board_class
+        self.records = records
+        self.sessions = {}
+        self.next_game = 0
+        self.finished_games = 0
+        self.moves = 0
+        # Bot moves sent to the pool and not finished yet
+        self.pending = 0
+        # Latencies (in seconds): of bot moves (from sending the board to the pool until the move is made, so with the
+        # time spent waiting in the queue) and of human moves (from receiving the move until the answer is sent)
+        self.bot_latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.human_latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.start_time = time.time()
+
+
+    def stats(self):
+        return {
+            'type': 'stats', 'games_in_flight': len(self.sessions), 'finished_games': self.finished_games,
+            'moves': self.moves, 'pending_bot_moves': self.pending, 'queue_depth': max(0, self.pending - self.workers),
+            'bot_move_latency': percentiles(self.bot_latencies), 'human_move_latency': percentiles(self.human_latencies),
+            'uptime': time.time() - self.start_time}
+
+
+    # Serve one client: read its requests until it disconnects. Its games are stopped when it does
+    async def handle_client(self, reader, writer):
+        tasks = {}
+
+        async def send(message):
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    kind = request['type']
+                except (ValueError, KeyError, TypeError):
+                    await send({'type': 'error', 'message': "A request should be a JSON object with a type"})
+                    continue
+
+                if kind == 'new':
+                    await self.new_game(request, send, tasks)
+                elif kind == 'stats':
+                    await send(self.stats())
+                elif kind in ('move', 'resign'):
+                    session = self.sessions.get(request.get('game'))
+                    if session is None or session.number not in tasks:
+                        await send({'type': 'error', 'message': "No such game of yours: %s" % request.get('game')})
+                    else:
+                        await session.human_moves.put((time.perf_counter(), request.get('move') if kind == 'move' else None))
+                else:
+                    await send({'type': 'error', 'message': "Unknown request type: %s" % kind})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+            writer.close()
+
+
+    # Start a game requested by a client
+    async def new_game(self, request, send, tasks):
+        white, black = request.get('white', 'human'), request.get('black', 'human')
+        try:
+            for player in (white, black):
+                if player != 'human':
+                    parse_spec(player)
+        except ValueError as ve:
+            await send({'type': 'error', 'message': ve.args[0]})
+            return
+        if len(self.sessions) >= self.max_games:
+            await send({'type': 'error', 'message': "Too many games at once, try again later"})
+            return
+
+        session = GameSession(self.next_game, white, black, send, self.board_class)
+        self.next_game += 1
+        self.sessions[session.number] = session
+        await send({'type': 'started', 'game': session.number, 'white': white, 'black': black})
+        task = asyncio.ensure_future(self.play(session))
+        tasks[session.number] = task
+        task.add_done_callback(lambda task: tasks.pop(session.number, None))
+
+
+    # The coroutine of a game: ask the players for their moves until the game finishes
+    async def play(self, session):
+        engine = session.engine
+        try:
+            while not engine.game_finished:
+                white = engine.white_moves
+                player = 'white' if white else 'black'
+                if session.is_human(white):
+                    received, move = await self.human_move(session, white)
+                    if move is None:
+                        await self.finish(session, 'black' if white else 'white', 'resigned')
+                        return
+                else:
+                    received = time.perf_counter()
+                    try:
+                        move = await self.bot_move(session.players[white], engine.board)
+                    except Exception as e:
+                        await self.finish(session, 'black' if white else 'white', 'crash', repr(e))
+                        return
+                    if not self.legal(engine.board, move):
+                        await self.finish(session, 'black' if white else 'white', 'illegal move')
+                        return
+
+                engine.make_move(move)
+                self.moves += 1
+                session.result['moves'] += [[{'y': point.y, 'x': point.x} for point in move]]
+                await session.send({'type': 'moved', 'game': session.number, 'player': player,
+                                    'move': move_to_text([(point.y, point.x) for point in move], white)})
+                (self.human_latencies if session.is_human(white) else self.bot_latencies).append(
+                    time.perf_counter() - received)
+
+            await self.finish(session, engine.winner if not engine.draw else '', engine.reason)
+        except (ConnectionError, asyncio.CancelledError):
+            self.sessions.pop(session.number, None)
+            raise
+
+
+    # Wait for a legal move of a human player. Returns the time when it was received and the move (None if they resigned)
+    async def human_move(self, session, white):
+        board = session.engine.board
+        await session.send({'type': 'your_move', 'game': session.number, 'player': 'white' if white else 'black',
+                            'legal': [move_to_text([(point.y, point.x) for point in move], white)
+                                      for move in board.legal_moves()]})
+        while True:
+            received, text = await session.human_moves.get()
+            if text is None:
+                return received, None
+            try:
+                move = text_to_move(str(text), white)
+                # The move is tried on the board first: Engine.make_move counts boring moves before checking the move
+                board.make_move(move)
+                return received, move
+            except ValueError as ve:
+                await session.send({'type': 'illegal', 'game': session.number, 'message': ve.args[0]})
+
+
+    # Compute a move of a bot in the pool
+    async def bot_move(self, spec, board):
+        self.pending += 1
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(
+                self.pool, _bot_move, spec, self.board_class, board.serialize())
+        finally:
+            self.pending -= 1
+        return [Position(y, x) for (y, x) in data]
+
+
+    # Check a move of a bot, without changing the board
+    @staticmethod
+    def legal(board, move):
+        try:
+            board.make_move(move)
+        except ValueError:
+            return False
+        return True
+
+
+    async def finish(self, session, winner, reason, error=None):
+        self.sessions.pop(session.number, None)
+        self.finished_games += 1
+        session.result['winner'], session.result['reason'] = winner, reason
+        if self.records is not None:
+            self.records.write(session.result, session.players[True], session.players[False])
+            self.records.flush()
+        message = {'type': 'end', 'game': session.number, 'winner': winner, 'reason': reason}
+        if error is not None:
+            message['error'] = error
+        await session.send(message)
+
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+# Run the server until it's interrupted, printing its statistics every report seconds
+async def serve(server, host='127.0.0.1', port=8765, unix=None, report=10):
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle_client, unix)
+    else:
+        listener = await asyncio.start_server(server.handle_client, host, port)
+    print("serving on %s" % (unix or '%s:%d' % (host, port)), file=sys.stderr)
+    async with listener:
+        while True:
+            await asyncio.sleep(report)
+            print(json.dumps(server.stats()), file=sys.stderr)
+
+
+# The load test: players connect to the server at once, every one plays games games against the bot, as white or black
+# at random, making random legal moves after thinking for think seconds. Returns the statistics of the run
+async def load_test(players=100, games=1, bot='Search:SearchBot:max_depth=2', think=0.0, host='127.0.0.1', port=8765,
+                    unix=None, seed=None):
+    generator = random.Random(seed)
+    # Latencies seen by the players: from sending a move until the bot's answer (or the end of the game) arrives
+    latencies = []
+    results = collections.Counter()
+    errors = []
+
+    async def player(number):
+        if unix:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        async def send(message):
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+        sent = None
+        try:
+            for i in range(games):
+                human_white = generator.random() < 0.5
+                await send({'type': 'new', 'white': 'human' if human_white else bot,
+                            'black': bot if human_white else 'human'})
+                while True:
+                    message = json.loads(await reader.readline())
+                    if message['type'] == 'your_move':
+                        if sent is not None:
+                            latencies.append(time.perf_counter() - sent)
+                        if think:
+                            await asyncio.sleep(think)
+                        sent = time.perf_counter()
+                        await send({'type': 'move', 'game': message['game'], 'move': generator.choice(message['legal'])})
+                    elif message['type'] == 'end':
+                        results[message['reason']] += 1
+                        sent = None
+                        break
+                    elif message['type'] in ('error', 'illegal'):
+                        errors.append(message['message'])
+                        break
+        finally:
+            writer.close()
+
+    start_time = time.time()
+    outcomes = await asyncio.gather(*[player(number) for number in range(players)], return_exceptions=True)
+    elapsed = time.time() - start_time
+    errors += [repr(outcome) for outcome in outcomes if isinstance(outcome, Exception)]
+    return {'players': players, 'games': sum(results.values()), 'reasons': dict(results), 'errors': len(errors),
+            'first_errors': errors[:3], 'time': elapsed, 'games_per_second': sum(results.values()) / elapsed,
+            'moves_per_second': len(latencies) / elapsed, 'latency': percentiles(latencies)}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="A server of many games at once, and its load test")
+    parser.add_argument('command', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="the path of a Unix socket, instead of TCP")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="processes computing moves of bots (serve)")
+    parser.add_argument('--max-games', type=int, default=1000, help="games played at once (serve)")
+    parser.add_argument('--bitboard', action='store_true', help="give the bots BitBoards instead of Boards (serve)")
+    parser.add_argument('--records', help="append finished games to this file of game records (serve)")
+    parser.add_argument('--report', type=float, default=10, help="seconds between the statistics (serve)")
+    parser.add_argument('--players', type=int, default=100, help="simulated players (load)")
+    parser.add_argument('--games', type=int, default=1, help="games of every player (load)")
+    parser.add_argument('--bot', default='Search:SearchBot:max_depth=2', help="the bot the players play against (load)")
+    parser.add_argument('--think', type=float, default=0.0, help="seconds a player thinks before every move (load)")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(arguments)
+
+    if args.command == 'load':
+        stats = asyncio.run(load_test(args.players, args.games, args.bot, args.think, args.host, args.port, args.unix,
+                                      args.seed))
+        print(json.dumps(stats, indent=1))
+        return 1 if stats['errors'] else 0
+
+    records = GameWriter(args.records) if args.records else None
+    server = GameServer(args.workers, args.max_games, BitBoard if args.bitboard else Board, records)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix, args.report))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if records is not None:
+            records.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+import itertools
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from Board import Board, EMPTY, WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING
+
+
+# Endgame tablebases: the exact result of every position with a few pieces, found by retrograde analysis.
+#
+# Positions are grouped by their material signature (white men, white kings, black men, black kings), always seen by the
+# player who moves next (white). Within a signature every position has an index, computed in O(1) from the squares of
+# its pieces (see rank), and the table of the signature keeps one byte per index:
+#   0     - a draw (or an index which isn't a position: two pieces on one square),
+#   d + 1 - the game ends after d more moves (plies) of perfect play: white wins if d is odd and loses if d is even.
+# The winning side plays the quickest win and the losing side the slowest loss. The draw after 25 boring moves
+# (Engine.limit_boring_moves) is ignored, so a result is exact only if the game can end before that counter runs out.
+#
+# A table is computed from the rules of Board: every position is set up, its legal_moves() are made with push, and the
+# positions after them are looked up. Moves which capture or crown lead to a signature with fewer pieces or fewer men,
+# which is already solved; the other moves lead to the same signature or its mirror (with the colours swapped), so these
+# two are solved together, going backward from the lost positions one ply at a time.
+# Signatures which don't depend on each other are solved in parallel, one per process.
+#
+# All the tables are kept in one file: a header, an index of the signatures and the tables themselves. The file is opened
+# with mmap, so probing a position only reads one byte of it.
+#
+#   python Tablebase.py --pieces 4 --output tablebase.bin
+
+# Results of probe, for the player who moves next
+WON = 1
+DRAWN = 0
+LOST = -1
+
+MAGIC = b'DRTB'
+VERSION = 1
+# Header: magic, version, maximum number of pieces, number of signatures
+HEADER = struct.Struct('<4sIII')
+# Index entry: the signature (4 bytes), the offset and the size of its table
+INDEX_ENTRY = struct.Struct('<4BQQ')
+
+# The squares a piece of every code can stand on, as (first square, number of squares). A man can't stand on the row where
+# it would be crowned: white men on squares 0 - 44 (rows 0 - 8), black men on squares 5 - 49 (rows 1 - 9)
+DOMAINS = {WHITE_MAN: (0, 45), WHITE_KING: (0, 50), BLACK_MAN: (5, 45), BLACK_KING: (0, 50)}
+CODES = [WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING]
+
+# BINOMIAL[n][k] is n choose k
+BINOMIAL = [[1 if k == 0 else 0 for k in range(51)] for n in range(51)]
+for _n in range(1, 51):
+    for _k in range(1, 51):
+        BINOMIAL[_n][_k] = BINOMIAL[_n - 1][_k - 1] + BINOMIAL[_n - 1][_k]
+
+
+# The number of indices of a signature
+def table_size(signature):
+    size = 1
+    for code, count in zip(CODES, signature):
+        size *= BINOMIAL[DOMAINS[code][1]][count]
+    return size
+
+
+# The signature of the same positions with the colours swapped
+def mirror(signature):
+    return signature[2], signature[3], signature[0], signature[1]
+
+
+# The index of a position, given the lists of squares (numbers of dark squares, increasing) of its men and kings,
+# in the order of CODES. Every group is numbered with the combinatorial number system
+def rank(groups):
+    index = 0
+    for code, squares in zip(CODES, groups):
+        first, size = DOMAINS[code]
+        group_index = 0
+        for i, square in enumerate(squares):
+            group_index += BINOMIAL[square - first][i + 1]
+        index = index * BINOMIAL[size][len(squares)] + group_index
+    return index
+
+
+# The squares of the men and kings of a board from its serialize, in the order of CODES
+def groups_of(data):
+    groups = ([], [], [], [], [])
+    for square, code in enumerate(data):
+        if code != EMPTY:
+            groups[code].append(square)
+    return groups[WHITE_MAN:]
+
+
+# Check that no man stands on the row where it should have been crowned
+def valid_men(groups):
+    return all(square < 45 for square in groups[0]) and all(square >= 5 for square in groups[2])
+
+
+# All the signatures with at most the given number of pieces (at least one for each player)
+def signatures(max_pieces):
+    result = []
+    for counts in itertools.product(range(max_pieces + 1), repeat=4):
+        if sum(counts) <= max_pieces and counts[0] + counts[1] > 0 and counts[2] + counts[3] > 0:
+            result.append(counts)
+    return result
+
+
+class Tablebase:
+    # Open a tablebase file
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_pieces, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a tablebase file", path)
+        # signature -> offset of its table
+        self.tables = {}
+        for i in range(count):
+            entry = INDEX_ENTRY.unpack_from(self.data, HEADER.size + i * INDEX_ENTRY.size)
+            self.tables[entry[:4]] = entry[4]
+        # Statistics
+        self.probes = 0
+        self.hits = 0
+
+
+    # A tablebase sent to another process opens the file again there
+    def __reduce__(self):
+        return Tablebase, (self.path,)
+
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+    # The byte kept for the board, or None if the board isn't in the tablebase
+    def probe_value(self, board):
+        self.probes += 1
+        data = board.serialize()
+        if 50 - data.count(EMPTY) > self.max_pieces:
+            return None
+        groups = groups_of(data)
+        signature = tuple(len(group) for group in groups)
+        # A player without pieces has lost
+        if signature[0] + signature[1] == 0:
+            self.hits += 1
+            return 1
+        offset = self.tables.get(signature)
+        if offset is None or not valid_men(groups):
+            return None
+        self.hits += 1
+        return self.data[offset + rank(groups)]
+
+
+    # Look the board up. Returns None if it isn't in the tablebase, otherwise a pair (result, distance): result is WON,
+    # DRAWN or LOST for the player who moves next (white) and distance is the number of plies until the end of the game
+    # (None for a draw)
+    def probe(self, board):
+        value = self.probe_value(board)
+        if value is None:
+            return None
+        if value == 0:
+            return DRAWN, None
+        return (WON if (value - 1) % 2 == 1 else LOST), value - 1
+
+
+    # The best move for the board (the quickest win, the slowest loss or a draw), or None if the board isn't in the tablebase
+    def best_move(self, board):
+        if self.probe_value(board) is None:
+            return None
+        board = board.copy()
+        best_move, best_key = None, None
+        for move in board.legal_moves():
+            board.push(move)
+            value = self.probe_value(board)
+            board.pop()
+            # After our move the opponent moves: a lost position for them (odd value) is the best, then a draw (0),
+            # then a won one (even value, the larger the better for us)
+            key = (2, -value) if value % 2 == 1 else (1, 0) if value == 0 else (0, value)
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+        return best_move
+
+
+# Solve a signature together with its mirror, using the tablebase file at path for the signatures they lead to.
+# Returns a dictionary: signature -> its table (bytes)
+# NumPy is needed only to generate tables, so probing them (e.g. by Engine) doesn't import it
+def solve(signature, path=None):
+    import numpy as np
+    tablebase = Tablebase(path) if path is not None and os.path.exists(path) else None
+    pair = [signature] if mirror(signature) == signature else [signature, mirror(signature)]
+    offsets = {}
+    n = 0
+    for s in pair:
+        offsets[s] = n
+        n += table_size(s)
+
+    valid = np.zeros(n, dtype=bool)
+    terminal = []
+    # Moves inside the pair (from source to destination)
+    sources, destinations = array('q'), array('q')
+    # How many moves of every position aren't known to lead to a won position (for the opponent) yet
+    remaining = np.zeros(n, dtype=np.int32)
+    # Moves out of the pair, by the ply at which they decide: to a lost position (a win for us), to a won one
+    exits_lost, exits_won = {}, {}
+
+    for s in pair:
+        groups_domains = [itertools.combinations(range(DOMAINS[code][0], DOMAINS[code][0] + DOMAINS[code][1]), count)
+                          for code, count in zip(CODES, s)]
+        for groups in itertools.product(*[list(g) for g in groups_domains]):
+            squares = [square for group in groups for square in group]
+            if len(set(squares)) != len(squares):
+                continue
+            node = offsets[s] + rank(groups)
+            valid[node] = True
+            data = bytearray(50)
+            for code, group in zip(CODES, groups):
+                for square in group:
+                    data[square] = code
+            board = Board.deserialize(bytes(data))
+
+            moves = board.legal_moves()
+            if not moves:
+                terminal.append(node)
+            for move in moves:
+                board.push(move)
+                child = board.serialize()
+                board.pop()
+                child_groups = groups_of(child)
+                child_signature = tuple(len(group) for group in child_groups)
+                if child_signature[0] + child_signature[1] == 0:
+                    # The opponent has no pieces left: they have lost
+                    value = 1
+                elif child_signature in offsets:
+                    sources.append(node)
+                    destinations.append(offsets[child_signature] + rank(child_groups))
+                    remaining[node] += 1
+                    continue
+                else:
+                    value = tablebase.data[tablebase.tables[child_signature] + rank(child_groups)]
+
+                # Only moves to won positions are ever taken off remaining, so a position with a move to a draw or
+                # to a lost position is never lost
+                remaining[node] += 1
+                if value != 0:
+                    if (value - 1) % 2 == 0:
+                        exits_lost.setdefault(value, array('q')).append(node)
+                    else:
+                        exits_won.setdefault(value, array('q')).append(node)
+
+    table = retrograde(n, valid, terminal, sources, destinations, remaining, exits_lost, exits_won)
+    if tablebase is not None:
+        tablebase.close()
+    return {s: table[offsets[s]:offsets[s] + table_size(s)].tobytes() for s in pair}
+
+
+# Retrograde analysis of a graph of n positions. Positions lost at ply 0 (terminal) are known; going backward, a position
+# is won at ply d if a move leads to a position lost at ply d - 1, and lost at ply d if all its moves lead to won positions,
+# the last of them won at ply d - 1. Moves out of the graph (exits) decide at known plies. Returns the values as bytes
+def retrograde(n, valid, terminal, sources, destinations, remaining, exits_lost, exits_won):
+    import numpy as np
+    sources = np.frombuffer(sources, dtype=np.int64) if len(sources) else np.zeros(0, dtype=np.int64)
+    destinations = np.frombuffer(destinations, dtype=np.int64) if len(destinations) else np.zeros(0, dtype=np.int64)
+    # Predecessors of every position, in compressed form: the predecessors of p are predecessors[starts[p]:starts[p + 1]]
+    order = np.argsort(destinations, kind='stable')
+    predecessors = sources[order]
+    starts = np.searchsorted(destinations[order], np.arange(n + 1))
+
+    def predecessors_of(nodes):
+        lengths = starts[nodes + 1] - starts[nodes]
+        total = int(lengths.sum())
+        positions = np.repeat(starts[nodes] - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return predecessors[positions]
+
+    values = np.zeros(n, dtype=np.uint8)
+    unresolved = valid.copy()
+    new = np.array(terminal, dtype=np.int64)
+    values[new] = 1
+    unresolved[new] = False
+    last_exit = max(list(exits_lost) + list(exits_won) + [0])
+
+    ply = 0
+    while len(new) or ply < last_exit:
+        ply += 1
+        if ply > 254:
+            raise ValueError("A distance doesn't fit in a byte", ply)
+        candidates = predecessors_of(new)
+        if ply % 2 == 1:
+            # Moves to positions lost at ply - 1 win at ply
+            if ply in exits_lost:
+                candidates = np.concatenate([candidates, np.frombuffer(exits_lost[ply], dtype=np.int64)])
+            new = np.unique(candidates)
+            new = new[unresolved[new]]
+        else:
+            # Moves to positions won at ply - 1 are bad; a position with only such moves is lost at ply
+            if ply in exits_won:
+                candidates = np.concatenate([candidates, np.frombuffer(exits_won[ply], dtype=np.int64)])
+            touched, counts = np.unique(candidates, return_counts=True)
+            remaining[touched] -= counts
+            new = touched[(remaining[touched] == 0) & unresolved[touched]]
+        values[new] = ply + 1
+        unresolved[new] = False
+    return values
+
+
+# Write the tables to a tablebase file (first to a temporary file, so that readers never see a half-written one)
+def write_tablebase(path, tables, max_pieces):
+    signatures = sorted(tables)
+    offset = HEADER.size + len(signatures) * INDEX_ENTRY.size
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, max_pieces, len(signatures)))
+        for signature in signatures:
+            f.write(INDEX_ENTRY.pack(*signature, offset, len(tables[signature])))
+            offset += len(tables[signature])
+        for signature in signatures:
+            f.write(tables[signature])
+    os.replace(temporary, path)
+
+
+# Generate all the tables up to max_pieces pieces and write them to path. Signatures are solved in stages (by the number
+# of pieces, then of men); the tables of a stage depend only on the earlier stages, so they are solved in parallel
+def generate(path, max_pieces, workers=None, verbose=True):
+    stages = {}
+    for signature in signatures(max_pieces):
+        if mirror(signature) < signature:
+            continue
+        stages.setdefault((sum(signature), signature[0] + signature[2]), []).append(signature)
+
+    tables = {}
+    start_time = time.time()
+    with ProcessPoolExecutor(workers) as pool:
+        for stage in sorted(stages):
+            previous = path if tables else None
+            for signature, result in zip(stages[stage], pool.map(solve, stages[stage], [previous] * len(stages[stage]))):
+                tables.update(result)
+                if verbose:
+                    for s, table in result.items():
+                        print(describe(s, table), file=sys.stderr)
+            write_tablebase(path, tables, max_pieces)
+    if verbose:
+        print("%d signatures, %d positions in %.1f s" % (len(tables), sum(len(t) for t in tables.values()),
+                                                         time.time() - start_time), file=sys.stderr)
+
+
+# A line of statistics about a table
+def describe(signature, table):
+    import numpy as np
+    values = np.frombuffer(table, dtype=np.uint8)
+    wins = values[(values > 0) & (values % 2 == 0)]
+    losses = values[values % 2 == 1]
+    return "%d%d%d%d: %9d entries, %9d won, %9d lost, longest win %3d plies" % (
+        *signature, len(values), len(wins), len(losses), int(wins.max()) - 1 if len(wins) else 0)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases")
+    parser.add_argument('--pieces', type=int, default=3, help="the maximum number of pieces on the board")
+    parser.add_argument('--output', default='tablebase.bin')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+    args = parser.parse_args(arguments)
+    generate(args.output, args.pieces, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Board import Board
+from BitBoard import BitBoard
+from Game import Game
+from Position import Position
+from Tablebase import Tablebase
+from OpeningBook import BookBot
+from GameRecord import GameWriter
+from BotProcess import TimeControl
+
+
+# A command-line tournament runner. Games are played headless: no sleeping between moves, no drawing and no printing,
+# spread over a pool of processes. Every finished game is written to the output file (one JSON object per line) as soon
+# as it finishes, and at the end a table of wins, draws and losses is printed.
+#
+# Bots are given as specs: module:Class, optionally followed by :key=value,key=value with the arguments of the class
+# and preceded by name= to give the bot a shorter name. For instance:
+#   python TournamentRunner.py Search:SearchBot fast=Search:SearchBot:time_limit=0.1 --format round-robin --games 4
+# The modules have to be importable (e.g. be in the current directory), so bots from notebooks have to be moved to files.
+#
+# Formats:
+#   round-robin - every bot plays every other bot, games times, with colours swapped in every other game
+#   gauntlet    - the first bot plays every other bot, games times, with colours swapped in every other game
+#   swiss       - rounds rounds; in every round bots with similar scores play each other twice (once with each colour)
+
+
+# How many of the slowest moves are reported
+SLOWEST_MOVES = 5
+
+
+# Split a bot spec into a name, a module, a class name and keyword arguments
+def parse_spec(spec):
+    name = None
+    if '=' in spec.split(':')[0]:
+        name, spec = spec.split('=', 1)
+    parts = spec.split(':', 2)
+    if len(parts) < 2:
+        raise ValueError("A bot should be given as module:Class", spec)
+    kwargs = {}
+    if len(parts) == 3 and parts[2]:
+        for argument in parts[2].split(','):
+            key, value = argument.split('=', 1)
+            kwargs[key] = ast.literal_eval(value)
+    return name or spec, parts[0], parts[1], kwargs
+
+
+# Tablebases opened in this process, by path: every worker opens a tablebase once and keeps it for all its games
+_tablebases = {}
+
+
+# The tablebase of a file, opened at the first game played with it in this process
+def open_tablebase(path):
+    if path not in _tablebases:
+        _tablebases[path] = Tablebase(path)
+    return _tablebases[path]
+
+
+# Create a bot from its spec
+def create_bot(spec):
+    name, module, class_name, kwargs = parse_spec(spec)
+    return getattr(importlib.import_module(module), class_name)(**kwargs)
+
+
+# Play one game in a worker process. Returns a record of the game
+# If a bot crashes (raises an exception), it loses the game. With the path of a tablebase, games are adjudicated by it;
+# with the path of an opening book, both bots play from it while they can. time_control is None or the arguments
+# of a TimeControl (per_move, base, increment); on_timeout is 'lose' or 'fallback' and ponder lets the bots think on
+# the opponent's time (see Game). opening is a list of moves (an even number of them, in the form of Game.result['moves'])
+# made before the bots start playing; they are the first moves of the record
+def play_game(white_spec, black_spec, use_bitboard=False, tablebase=None, book=None, time_control=None, on_timeout='lose',
+              ponder=False, opening=()):
+    if len(opening) % 2:
+        raise ValueError("An opening should have an even number of moves, so that white moves after it", opening)
+    start_time = time.time()
+    white, black = create_bot(white_spec), create_bot(black_spec)
+    if book:
+        white, black = BookBot(white, book), BookBot(black, book)
+    game = Game(white, black, BitBoard if use_bitboard else Board, verbose=False,
+                tablebase=open_tablebase(tablebase) if tablebase else None,
+                time_control=TimeControl(*time_control) if time_control else None, on_timeout=on_timeout,
+                ponder=ponder)
+    game.move_length = 0
+    for move in opening:
+        game.engine.make_move([Position(point['y'], point['x']) for point in move])
+    error = None
+    try:
+        result = game.play_bots(draw_board=False)
+    except Exception as e:
+        result = game.result
+        result['winner'] = 'black' if game.engine.white_moves else 'white'
+        result['reason'] = 'crash'
+        error = repr(e)
+
+    for bot in [game.white, game.black]:
+        if hasattr(bot, 'close'):
+            bot.close()
+    return {
+        'white': white_spec, 'black': black_spec, 'winner': result['winner'] or 'draw', 'reason': result['reason'],
+        'plies': len(opening) + len(result['moves']), 'moves': list(opening) + result['moves'], 'stats': result['stats'],
+        'time': time.time() - start_time, 'error': error}
+
+
+# Pairings (white, black) of a round-robin tournament
+def round_robin(bots, games):
+    pairings = []
+    for game in range(games):
+        for i in range(len(bots)):
+            for j in range(i + 1, len(bots)):
+                pairings += [(bots[i], bots[j]) if game % 2 == 0 else (bots[j], bots[i])]
+    return pairings
+
+
+# Pairings (white, black) of a gauntlet: the first bot against all the others
+def gauntlet(bots, games):
+    pairings = []
+    for game in range(games):
+        for opponent in bots[1:]:
+            pairings += [(bots[0], opponent) if game % 2 == 0 else (opponent, bots[0])]
+    return pairings
+
+
+# Pairings of one round of a swiss tournament: bots sorted by their points are paired with the nearest bot they haven't
+# played yet. Every pair plays two games, one with each colour. With an odd number of bots, the last one gets a bye
+def swiss_round(bots, standings, played):
+    order = sorted(bots, key=lambda bot: -standings[bot]['points'])
+    pairings = []
+    while len(order) > 1:
+        bot = order.pop(0)
+        opponent = next((other for other in order if (bot, other) not in played), order[0])
+        order.remove(opponent)
+        played.add((bot, opponent))
+        played.add((opponent, bot))
+        pairings += [(bot, opponent), (opponent, bot)]
+    if order:
+        standings[order[0]]['points'] += 1
+        standings[order[0]]['byes'] += 1
+    return pairings
+
+
+# Add the result of a game to the standings and to the cross table
+def record_result(record, standings, cross):
+    white, black = record['white'], record['black']
+    if record['winner'] == 'draw':
+        results = [(white, black, 'draws', 0.5), (black, white, 'draws', 0.5)]
+    elif record['winner'] == 'white':
+        results = [(white, black, 'wins', 1), (black, white, 'losses', 0)]
+    else:
+        results = [(white, black, 'losses', 0), (black, white, 'wins', 1)]
+    for bot, opponent, kind, points in results:
+        standings[bot][kind] += 1
+        standings[bot]['points'] += points
+        cross[bot][opponent] = cross[bot].get(opponent, 0) + points
+    if record['error']:
+        standings[white if record['winner'] == 'black' else black]['crashes'] += 1
+
+
+# Add the statistics of the plies of a game to the timings: for every bot the thinking times of all its moves, its CPU
+# and engine time and its search statistics, and a list of the slowest moves of the tournament
+def record_timing(record, timings, game_number):
+    for ply, stats in enumerate(record['stats']):
+        bot = record[stats['player']]
+        timing = timings['bots'][bot]
+        timing['think_times'] += [stats['think_time']]
+        timing['cpu_time'] += stats['cpu_time']
+        timing['engine_time'] += stats['engine_time']
+        search = stats.get('search', {})
+        if 'nodes' in search:
+            timing['nodes'] += search['nodes']
+            timing['search_time'] += search.get('time', 0)
+            timing['depths'] += [search.get('depth', 0)]
+        if 'ponder_hit' in search:
+            timing['ponders'] += 1
+            timing['ponder_hits'] += search['ponder_hit']
+        timings['slowest'] += [(stats['think_time'], bot, game_number, ply)]
+    timings['slowest'] = sorted(timings['slowest'], reverse=True)[:SLOWEST_MOVES]
+
+
+# Play the given games in the pool, writing every record to output as soon as its game finishes (and to records,
+# a GameWriter, if it's given). options are the keyword arguments of play_game
+def run_games(pool, pairings, options, output, records, standings, cross, timings, progress):
+    futures = [pool.submit(play_game, white, black, **options) for (white, black) in pairings]
+    for future in as_completed(futures):
+        record = future.result()
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+        if records is not None:
+            records.write(dict(record, winner='' if record['winner'] == 'draw' else record['winner']),
+                          record['white'], record['black'])
+            records.flush()
+        record_result(record, standings, cross)
+        record_timing(record, timings, progress['games'])
+        progress['games'] += 1
+        progress['plies'] += record['plies']
+        if progress['verbose']:
+            print("%d games, %s vs %s: %s" % (progress['games'], record['white'], record['black'], record['winner']), file=sys.stderr)
+
+
+# Print where the time of every bot went: its thinking time per move (mean, median, 95th percentile and maximum),
+# the share of it spent on the CPU of its process, the time of the engine checking its moves, its search speed and
+# how often it guessed the opponent's move while pondering.
+# Then the slowest moves of the tournament (games are numbered in the order in which they finished)
+def print_timings(bots, names, width, timings):
+    print()
+    print("%-*s %6s %9s %9s %9s %9s %5s %9s %9s %6s %6s" % (
+        width, "bot", "moves", "mean ms", "median ms", "p95 ms", "max ms", "cpu %", "engine ms", "nodes/s", "depth", "hits %"))
+    for bot in bots:
+        timing = timings['bots'][bot]
+        times = sorted(timing['think_times'])
+        if not times:
+            continue
+        total = sum(times)
+        print("%-*s %6d %9.1f %9.1f %9.1f %9.1f %5.0f %9.1f %9.0f %6.1f %6s" % (
+            width, names[bot], len(times), 1000 * total / len(times), 1000 * times[len(times) // 2],
+            1000 * times[min(len(times) - 1, int(0.95 * len(times)))], 1000 * times[-1],
+            100 * timing['cpu_time'] / total if total > 0 else 0, 1000 * timing['engine_time'] / len(times),
+            timing['nodes'] / timing['search_time'] if timing['search_time'] > 0 else 0,
+            sum(timing['depths']) / len(timing['depths']) if timing['depths'] else 0,
+            "%.0f" % (100 * timing['ponder_hits'] / timing['ponders']) if timing['ponders'] else "-"))
+
+    if timings['slowest']:
+        print()
+        print("slowest moves:")
+        for think_time, bot, game_number, ply in timings['slowest']:
+            print("  %9.1f ms  %-*s game %d, ply %d" % (1000 * think_time, width, names[bot], game_number, ply))
+
+
+# Print the standings, the cross table and the timings
+def print_tables(bots, standings, cross, timings, elapsed, progress):
+    names = {bot: parse_spec(bot)[0] for bot in bots}
+    width = max(len(name) for name in names.values()) + 2
+    print()
+    print("%-*s %7s %5s %5s %6s %7s" % (width, "bot", "points", "wins", "draws", "losses", "crashes"))
+    for bot in sorted(bots, key=lambda bot: -standings[bot]['points']):
+        s = standings[bot]
+        print("%-*s %7.1f %5d %5d %6d %7d" % (width, names[bot], s['points'], s['wins'], s['draws'], s['losses'], s['crashes']))
+
+    print()
+    print(" " * width + "".join("%8s" % names[bot][:7] for bot in bots))
+    for bot in bots:
+        print("%-*s" % (width, names[bot]) + "".join(
+            "%8s" % ("-" if bot == opponent else "%.1f" % cross[bot].get(opponent, 0)) for opponent in bots))
+
+    print_timings(bots, names, width, timings)
+
+    print()
+    print("%d games, %d plies in %.1f s: %.2f games/s, %.1f plies/s" % (
+        progress['games'], progress['plies'], elapsed, progress['games'] / elapsed, progress['plies'] / elapsed))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Play a headless tournament between bots")
+    parser.add_argument('bots', nargs='+', help="bots, as [name=]module:Class[:key=value,...]")
+    parser.add_argument('--format', choices=['round-robin', 'gauntlet', 'swiss'], default='round-robin')
+    parser.add_argument('--games', type=int, default=2, help="games per pair of bots (round-robin and gauntlet)")
+    parser.add_argument('--rounds', type=int, default=3, help="number of rounds (swiss)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument('--output', default='tournament.jsonl', help="file where the records of games are written")
+    parser.add_argument('--records', help="also append the games to this file of compact game records (see GameRecord.py)")
+    parser.add_argument('--bitboard', action='store_true', help="give the bots BitBoards instead of Boards")
+    parser.add_argument('--tablebase', help="adjudicate games with this tablebase file (see Tablebase.py)")
+    parser.add_argument('--book', help="let the bots play from this opening book (see OpeningBook.py)")
+    parser.add_argument('--time-per-move', type=float, help="seconds per move (the bots play in their own processes)")
+    parser.add_argument('--base', type=float, help="seconds per game (the bots play in their own processes)")
+    parser.add_argument('--increment', type=float, default=0, help="seconds added after every move, with --base")
+    parser.add_argument('--on-timeout', choices=['lose', 'fallback'], default='lose',
+                        help="what happens when a bot's time runs out: it loses, or a random move is played for it")
+    parser.add_argument('--ponder', action='store_true', help="let the bots think on the opponent's time")
+    parser.add_argument('--quiet', action='store_true', help="don't report every finished game")
+    args = parser.parse_args(arguments)
+
+    bots = args.bots
+    for bot in bots:
+        parse_spec(bot)
+    if len(set(bots)) != len(bots):
+        parser.error("every bot has to be given only once (use name= to enter the same bot twice)")
+    standings = {bot: {'points': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'crashes': 0, 'byes': 0} for bot in bots}
+    cross = {bot: {} for bot in bots}
+    timings = {'bots': {bot: {'think_times': [], 'cpu_time': 0, 'engine_time': 0, 'nodes': 0, 'search_time': 0, 'depths': [],
+                              'ponders': 0, 'ponder_hits': 0}
+                        for bot in bots},
+               'slowest': []}
+    progress = {'games': 0, 'plies': 0, 'verbose': not args.quiet}
+    if args.time_per_move is not None and args.base is not None:
+        parser.error("give either --time-per-move or --base")
+    time_control = (args.time_per_move, args.base, args.increment) if args.time_per_move or args.base else None
+    options = {'use_bitboard': args.bitboard, 'tablebase': args.tablebase, 'book': args.book,
+               'time_control': time_control, 'on_timeout': args.on_timeout, 'ponder': args.ponder}
+
+    start_time = time.time()
+    records = GameWriter(args.records) if args.records else None
+    with open(args.output, 'a') as output, ProcessPoolExecutor(args.workers) as pool:
+        if args.format == 'swiss':
+            played = set()
+            for round_number in range(args.rounds):
+                run_games(pool, swiss_round(bots, standings, played), options, output, records, standings, cross, timings,
+                          progress)
+        else:
+            pairings = round_robin(bots, args.games) if args.format == 'round-robin' else gauntlet(bots, args.games)
+            run_games(pool, pairings, options, output, records, standings, cross, timings, progress)
+    if records is not None:
+        records.close()
+
+    print_tables(bots, standings, cross, timings, time.time() - start_time, progress)
+    return standings
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+from Position import Position
+
+
+# A transposition table remembers the results of searching positions (keyed by their Zobrist keys, see Zobrist.py),
+# so a search which reaches the same position again (by a different order of moves, in the next iteration of iterative
+# deepening or in the next move of a game) doesn't have to search it from scratch.
+# The table has a fixed number of slots, chosen to fit in the given memory budget. Every position goes to the slot given by
+# the lowest bits of its key. When two positions want the same slot, the one searched deeper stays (depth-preferred
+# replacement), unless it was stored during an older search - then it's always replaced.
+
+# Bound types of the stored scores
+EXACT = 0
+# The search failed high: the real score is at least the stored one
+LOWER = 1
+# The search failed low: the real score is at most the stored one
+UPPER = 2
+
+# Approximate number of bytes taken by one entry: the tuple, its fields, the encoded move and the slot in the list
+ENTRY_SIZE = 200
+
+
+# Moves are stored as tuples of square numbers (10 * y + x), which are smaller than lists of Positions
+def encode_move(move):
+    return tuple(10 * p.y + p.x for p in move)
+
+
+def decode_move(code):
+    return [Position(square // 10, square % 10) for square in code]
+
+
+class TranspositionTable:
+    # Create an empty table which takes about the given number of megabytes
+    def __init__(self, megabytes=16):
+        self.size = 1
+        while 2 * self.size * ENTRY_SIZE <= megabytes * 1024 * 1024:
+            self.size *= 2
+        self.mask = self.size - 1
+        self.slots = [None] * self.size
+        self.generation = 0
+        # Statistics, useful to see how well the table works
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+
+    # Tell the table that a new search starts. Entries from the previous searches are kept, but can be replaced by anything
+    def new_search(self):
+        self.generation += 1
+
+
+    # Forget everything
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+
+    # Return the entry stored for the key, or None. An entry is a tuple (key, depth, score, bound, move, generation),
+    # where move is encoded with encode_move (or is None, if no best move is known)
+    def probe(self, key):
+        self.probes += 1
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+
+    # Store the result of searching a position to the given depth
+    def store(self, key, depth, score, bound, move=None):
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None and entry[0] != key and entry[5] == self.generation and entry[1] > depth:
+            return
+        # If we don't know the best move now, keep the one we knew before
+        if move is None and entry is not None and entry[0] == key:
+            move = entry[4]
+        self.slots[index] = (key, depth, score, bound, move, self.generation)
+        self.stores += 1
+
+
+    # Return the fraction of the slots which are in use (checked on a sample of them)
+    def usage(self):
+        sample = self.slots[:1000]
+        return sum(1 for entry in sample if entry is not None) / len(sample)
@@ -0,0 +1,26 @@
+import random
+
+
+# Zobrist hashing of positions. Every kind of piece (colour, king or not) standing on every square gets a random 64-bit number,
+# and the key of a position is the xor of the numbers of all the pieces on the board.
+# Keys describe the board as the player who moves next sees it (white moves next), so the same position gets the same key
+# no matter which player is about to move. This is also why no extra number for the side to move is needed.
+
+_random = random.Random(20200401)
+
+# ZOBRIST[white][king][y][x] is the number of a piece standing on (y, x)
+ZOBRIST = [[[[_random.getrandbits(64) for x in range(10)] for y in range(10)] for king in range(2)] for white in range(2)]
+
+# MIRRORED[white][king][y][x] is the number of the same piece after the board is turned around
+# (it moves to (9 - y, 9 - x) and changes its colour)
+MIRRORED = [[[[ZOBRIST[1 - white][king][9 - y][9 - x] for x in range(10)] for y in range(10)] for king in range(2)] for white in range(2)]
+
+
+# Compute the key of a board from scratch (boards keep their keys up to date themselves, this is useful for checking them)
+def compute_key(board):
+    key = 0
+    for white in board.whites:
+        key ^= ZOBRIST[1][white.king][white.y][white.x]
+    for black in board.blacks:
+        key ^= ZOBRIST[0][black.king][black.y][black.x]
+    return key